@@ -1,22 +1,38 @@
-from datetime import datetime
+import os
 import time
 import threading
 import queue
 import math
 
-import ccxt
-import telegram.ext as telegram
-
-from utils import load_config, Console, Telegram
+from utils import load_config, Config, Console, Telegram
+from trades_index import TradesIndex
+from scheduler import PollScheduler
+import order_state
+from order_journal import OrderJournal
+from command_queue import CommandQueue
+from key_pool import KeyPool, MonotonicNonce, NonceStore
+from markets_cache import load_markets
+from order_book import OrderBook
+from quote_cache import QuoteCache
+from flow_window import FlowWindow
+from retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+import metrics
+import tracing
 
 
 DEBUG = False
 EXCHANGE_TIMEOUT = 1
 
-config = load_config()
-console = Console(log_file_name=config.log_file_path)
-telebot = Telegram(config=config.telegram)
-trader_commands = queue.Queue()
+# Set up by create_app, importing the module needs neither a config nor credentials
+config = None
+console = Console()
+telebot = None
+exchange_api = None
+quote_cache = None
+price_source = None
+trace_log = tracing.TraceLog()
+order_books = {}
+pipelines = {}
 
 
 def console_log_order(comment, order, color=None):
@@ -43,175 +59,330 @@ def telegram_log_order(comment, order):
     telebot.log(msg=msg)
 
 
+def pair_file_name(file_name, symbol):
+    if not file_name:
+        return file_name
+    root, ext = os.path.splitext(file_name)
+    return '{}_{}{}'.format(root, symbol.replace('/', '_').lower(), ext)
+
+
 class BTCTradeUA:
-    def __init__(self, exchange_config):
+    # Public market data and private (nonce-signed) calls are limited separately,
+    # so trade book polling never queues behind order placement.
+    ENDPOINT_GROUPS = {
+        'create_order': 'private',
+        'check_order': 'private',
+        'delete_order': 'private',
+        'fetch_open_orders': 'private',
+        'get_market_price': 'private',
+        'fetch_trade_book': 'public',
+        'fetch_order_book': 'public',
+    }
+
+    def __init__(self, exchange_config, api_concurrency=None, retry_config=None, breaker_config=None, api_url=None,
+                 nonce_path=None):
+        import ccxt
+        from requests.adapters import HTTPAdapter
+
         self.exchange_config = exchange_config
-        self.api = ccxt.btctradeua(config=self.exchange_config.to_dict())
-        self.api.nonce = ccxt.Exchange.milliseconds
-        self.api_lock = threading.Lock()
+        self.network_errors = ccxt.NetworkError
+        api_concurrency = api_concurrency or Config()
+        public_slots = api_concurrency.public or 4
+
+        # Every key pair of the account gets its own client and nonce sequence. A key signs one request at a time,
+        # so its nonces reach the exchange in order, and private calls run in parallel across the keys.
+        base_config = {key: val for key, val in self.exchange_config.to_dict().items() if key != 'keys'}
+        keys = self.exchange_config.to_dict().get('keys') or [{}]
+        nonce_store = NonceStore(nonce_path) if nonce_path else None
+        self.apis = []
+        for index, key in enumerate(keys):
+            api = ccxt.btctradeua(config=dict(base_config, **key))
+            api.nonce = MonotonicNonce(store=nonce_store, key=api.apiKey or '')
+            if api_url:
+                api.urls['api'] = api_url
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1 + (public_slots if index == 0 else 0))
+            api.session.mount('https://', adapter)
+            api.session.mount('http://', adapter)
+            self.apis.append(api)
+        self.api = self.apis[0]
+
+        self.api_slots = {
+            'public': KeyPool([self.api], slots_per_api=public_slots),
+            'private': KeyPool(self.apis),
+        }
+        metrics.registry.gauge('btctradeua_keys_in_use', 'API keys with a private request in flight',
+                               func=self.api_slots['private'].in_use)
+
+        self.retry_policy = RetryPolicy.from_config(retry_config)
+        self.breakers = {
+            group: CircuitBreaker.from_config(name='BTCTradeUA {}'.format(group), config=breaker_config)
+            for group
+            in self.api_slots
+        }
 
     def milliseconds(self):
         return self.api.milliseconds()
 
+    def load_markets(self, file_name=None, ttl=86400):
+        load_markets(self.api, file_name=file_name, ttl=ttl)
+        for api in self.apis[1:]:
+            api.set_markets(self.api.markets, self.api.currencies)
+
+    def _call(self, endpoint, api_method, **kwargs):
+        group = self.ENDPOINT_GROUPS[endpoint]
+        breaker = self.breakers[group]
+        request_seconds = metrics.registry.histogram('btctradeua_request_seconds', 'BTCTradeUA request latency',
+                                                     endpoint=endpoint)
+        slot_wait_seconds = metrics.registry.histogram('btctradeua_slot_wait_seconds',
+                                                       'Time spent waiting for an API slot', group=group)
+        deadline = time.monotonic() + self.retry_policy.deadline
+        attempt = 0
+        while True:
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                metrics.registry.counter('btctradeua_circuit_open_total', 'Calls rejected by an open circuit',
+                                         endpoint=endpoint).inc()
+                raise
+            try:
+                wait_started = time.monotonic()
+                with self.api_slots[group].acquire() as api:
+                    started = time.monotonic()
+                    slot_wait_seconds.observe(started - wait_started)
+                    try:
+                        result = getattr(api, api_method)(**kwargs)
+                    finally:
+                        request_seconds.observe(time.monotonic() - started)
+            except self.network_errors as e:
+                breaker.record_failure()
+                metrics.registry.counter('btctradeua_errors_total', 'BTCTradeUA request errors',
+                                         endpoint=endpoint, error=type(e).__name__).inc()
+                # Back off outside of the slot, so other threads keep using the endpoint group meanwhile
+                delay = self.retry_policy.delay(attempt)
+                attempt += 1
+                if time.monotonic() + delay > deadline:
+                    raise
+                metrics.registry.counter('btctradeua_retries_total', 'BTCTradeUA request retries',
+                                         endpoint=endpoint).inc()
+                time.sleep(delay)
+            except Exception as e:
+                breaker.record_error()
+                metrics.registry.counter('btctradeua_errors_total', 'BTCTradeUA request errors',
+                                         endpoint=endpoint, error=type(e).__name__).inc()
+                raise
+            else:
+                breaker.record_success()
+                return result
+
     def create_order(self, side, symbol, amount, price):
-        with self.api_lock:
-            while True:
-                try:
-                    return self.api.request(
-                        path='{}/{}_{}'.format(side, symbol.split('/')[0], symbol.split('/')[1]).lower(),
-                        api='private',
-                        method='POST',
-                        params={
-                            'count': amount,
-                            'price': price,
-                            'currency1': symbol.split('/')[1],
-                            'currency': symbol.split('/')[0],
-                        }
-                    )
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        return self._call(
+            'create_order', 'request',
+            path='{}/{}_{}'.format(side, symbol.split('/')[0], symbol.split('/')[1]).lower(),
+            api='private',
+            method='POST',
+            params={
+                'count': amount,
+                'price': price,
+                'currency1': symbol.split('/')[1],
+                'currency': symbol.split('/')[0],
+            }
+        )
 
     def check_order(self, order_id):
-        with self.api_lock:
-            while True:
-                try:
-                    return self.api.request(
-                        path='order/status/{}'.format(order_id),
-                        api='private',
-                        method='POST'
-                    )
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        return self._call(
+            'check_order', 'request',
+            path='order/status/{}'.format(order_id),
+            api='private',
+            method='POST'
+        )
 
     def delete_order(self, symbol, order_id):
-        with self.api_lock:
-            while True:
-                try:
-                    resp = self.check_order(order_id=order_id)
-                    if resp['status'] == 'processing':
-                        return self.api.request(
-                            path='order/remove/{}_{}/{}'.format(symbol.split('/')[0], symbol.split('/')[1],
-                                                                order_id).lower(),
-                            api='private',
-                            method='POST'
-                        )
-                    else:
-                        return resp
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        resp = self.check_order(order_id=order_id)
+        if resp['status'] == 'processing':
+            return self._call(
+                'delete_order', 'request',
+                path='order/remove/{}_{}/{}'.format(symbol.split('/')[0], symbol.split('/')[1], order_id).lower(),
+                api='private',
+                method='POST'
+            )
+        else:
+            return resp
+
+    def fetch_open_orders(self, symbol):
+        resp = self._call(
+            'fetch_open_orders', 'request',
+            path='my_orders/{}_{}'.format(symbol.split('/')[0], symbol.split('/')[1]).lower(),
+            api='private',
+            method='POST'
+        )
+        if not isinstance(resp, dict) or not isinstance(resp.get('your_open_orders'), list):
+            return None
+        return {
+            str(order['id']): float(order['amnt_trade'])
+            for order
+            in resp['your_open_orders']
+        }
 
     def fetch_trade_book(self, symbol):
-        with self.api_lock:
-            while True:
-                try:
-                    return self.api.fetch_trades(symbol=symbol)
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        return self._call('fetch_trade_book', 'fetch_trades', symbol=symbol)
 
     def fetch_order_book(self, symbol):
-        with self.api_lock:
-            while True:
-                try:
-                    return self.api.fetch_order_book(symbol=symbol)
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        return self._call('fetch_order_book', 'fetch_order_book', symbol=symbol)
 
     def get_market_price(self, side, symbol, amount):
-        with self.api_lock:
-            while True:
-                try:
-                    if side == 'buy':
-                        return self.api.request(
-                            path='/ask/{}_{}'.format(symbol.split('/')[0], symbol.split('/')[1]).lower(),
-                            api='private',
-                            method='POST',
-                            params={
-                                'amount': amount
-                            }
-                        )
-                    elif side == 'sell':
-                        return self.api.request(
-                            path='/bid/{}_{}'.format(symbol.split('/')[0], symbol.split('/')[1]).lower(),
-                            api='private',
-                            method='POST',
-                            params={
-                                'amount': amount
-                            }
-                        )
-                except ccxt.NetworkError:
-                    time.sleep(0.25)
+        if side == 'buy':
+            path = '/ask/{}_{}'.format(symbol.split('/')[0], symbol.split('/')[1]).lower()
+        elif side == 'sell':
+            path = '/bid/{}_{}'.format(symbol.split('/')[0], symbol.split('/')[1]).lower()
+        else:
+            return None
+        return self._call(
+            'get_market_price', 'request',
+            path=path,
+            api='private',
+            method='POST',
+            params={
+                'amount': amount
+            }
+        )
 
 
 class TradeBookWatcher(threading.Thread):
-    def __init__(self, ex_api, target_user_trades, target_user_trades_fetched):
-        super(TradeBookWatcher, self).__init__()
+    def __init__(self, ex_api, symbol, target_user_trades, target_user_trades_fetched, stopped=None):
+        super(TradeBookWatcher, self).__init__(name='TradeBookWatcher {}'.format(symbol))
         self.daemon = True
+        self.stopped = stopped or threading.Event()
         self.ex_api = ex_api
+        self.symbol = symbol
         self.target_user_trades = target_user_trades
         self.target_user_trades_fetched = target_user_trades_fetched
 
+    def process_trades(self, trades, reported_trades):
+        new_trades_count = 0
+        for trade in sorted(trades, key=lambda t: t['timestamp']):
+            is_target_user = trade['info']['user'] in config.target_users_names
+            is_not_reported_yet = not reported_trades.contains(trade)
+            is_mean = trade['amount'] >= config.min_mean_trade_amount
+            is_new = (self.ex_api.milliseconds() - trade['timestamp']) < config.max_trade_age*1000
+
+            if is_target_user and is_mean and is_not_reported_yet:
+                if is_new:
+                    trade['trace'] = {'exchange': trade['timestamp'],
+                                      'detected': self.ex_api.milliseconds()}
+                    self.target_user_trades.put(trade)
+                    reported_trades.add(trade)
+                    new_trades_count += 1
+                    console_log_order('New trade ({})'.format(trade['info']['user']), trade,
+                                      color=('yellow' if trade['side'] == 'sell' else 'blue'))
+                    telegram_log_order('New trade ({})'.format(trade['info']['user']), trade)
+                else:
+                    reported_trades.add(trade)
+                    console_log_order('Old trade ({})'.format(trade['info']['user']), trade)
+        return new_trades_count
+
     def run(self):
-        reported_orders_ids = []
+        reported_trades = TradesIndex(file_name=pair_file_name(config.trades_index_path, self.symbol),
+                                      retention=config.trades_index_retention or 3600)
+        schedule = PollScheduler.from_config(config.trade_book_poll, default_interval=10)
         errors_count = 0
-        while True:
+        while not self.stopped.is_set():
             try:
                 if not self.target_user_trades_fetched.is_set():
-                    trades = self.ex_api.fetch_trade_book(symbol=config.target_pair)
-                    for trade in sorted(trades, key=lambda t: t['timestamp']):
-                        is_target_user = trade['info']['user'] in config.target_users_names
-                        is_not_reported_yet = trade['id'] not in reported_orders_ids
-                        is_mean = trade['amount'] >= config.min_mean_trade_amount
-                        is_new = (self.ex_api.milliseconds() - trade['timestamp']) < config.max_trade_age*1000
-
-                        if is_target_user and is_mean and is_not_reported_yet:
-                            if is_new:
-                                self.target_user_trades.put(trade)
-                                reported_orders_ids.append(trade['id'])
-                                console_log_order('New trade ({})'.format(trade['info']['user']), trade,
-                                                  color=('yellow' if trade['side'] == 'sell' else 'blue'))
-                                telegram_log_order('New trade ({})'.format(trade['info']['user']), trade)
-                            else:
-                                reported_orders_ids.append(trade['id'])
-                                console_log_order('Old trade ({})'.format(trade['info']['user']), trade)
-
+                    trades = self.ex_api.fetch_trade_book(symbol=self.symbol)
+                    new_trades_count = self.process_trades(trades, reported_trades)
+                    reported_trades.save()
                     self.target_user_trades_fetched.set()
 
-                while True:
-                    now = datetime.now()
-                    if now.second % 10 == 0:
-                        break
+                    # Poll faster while the target users are trading, back off while the book is quiet
+                    if new_trades_count:
+                        schedule.active()
                     else:
-                        time.sleep(0.5)
-                    errors_count = 0
+                        schedule.idle()
+
+                schedule.wait()
+                errors_count = 0
             except KeyboardInterrupt:
                 break
             except SystemExit:
                 raise
+            except CircuitOpenError as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                time.sleep(min(e.retry_after, 5))
             except Exception as e:
                 if DEBUG:
                     raise
-                console.log('{:20}: {}'.format('OrderbookWatcher', str(e)), is_ok=0)
-                telebot.log('{:20}: {}'.format('OrderbookWatcher', str(e)))
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
                 errors_count += 1
                 if errors_count > 10:
-                    console.log('{:20}: {}'.format('OrderbookWatcher', 'Too many errors. Stopping'), is_ok=0)
-                    telebot.log('{:20}: {}'.format('OrderbookWatcher', 'Too many errors. Stopping'))
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
                     break
                 else:
                     time.sleep(1)
 
 
 class Analyzer(threading.Thread):
-    def __init__(self, ex_api, target_user_trades, target_user_trades_fetched):
-        super(Analyzer, self).__init__()
+    def __init__(self, ex_api, symbol, target_user_trades, target_user_trades_fetched, trader_commands, stopped=None):
+        super(Analyzer, self).__init__(name='Analyzer {}'.format(symbol))
         self.daemon = True
+        self.stopped = stopped or threading.Event()
         self.ex_api = ex_api
+        self.symbol = symbol
         self.target_user_trades = target_user_trades
         self.target_user_trades_fetched = target_user_trades_fetched
+        self.trader_commands = trader_commands
+        self.flow = FlowWindow(window=config.flow_window or config.max_trade_age)
+        self.last_signal = 0.0
+
+    def is_fast_combination(self):
+        amount_buy, amount_sell = self.flow.amount('buy'), self.flow.amount('sell')
+        return (amount_buy and amount_sell) and math.fabs(1-(amount_buy/amount_sell)) < 0.2
+
+    def signal(self):
+        # A fast buy/sell combination is no decision, the signal stays where it was instead of unwinding the position
+        if not self.is_fast_combination():
+            self.last_signal = (self.flow.amount('buy') - self.flow.amount('sell')) * config.order_amount_mult
+        return self.last_signal
+
+    def process_trades(self, trades):
+        # Only the change of the window signal caused by the new trades is traded, evictions never trigger orders
+        now = self.ex_api.milliseconds()
+        self.flow.evict(now=now)
+        signal_before = self.signal()
+        # No eviction after the batch is added, a trade just accepted at the age limit is traded, not dropped
+        for trade in trades:
+            self.flow.add(trade)
+        signal_after = self.signal()
+
+        amount = signal_after - signal_before
+        if math.fabs(amount) < 1e-12:
+            if self.is_fast_combination():
+                console.log('{:20}: {}'.format('Analyzer\'s idea', 'Fast buy/sell combination.'), n=1)
+            return None
+
+        side = 'buy' if amount > 0 else 'sell'
+        amount = math.fabs(amount)
+        price = get_market_price(side=side, symbol=self.symbol, amount=amount)
+        # The oldest trade of the batch is traced, so the reported latency covers every trade in it
+        traced_trade = min((trade for trade in trades if 'trace' in trade), key=lambda t: t['timestamp'], default=None)
+        return {
+            'command_type': 'create_order',
+            'source': 'analyzer',
+            'timestamp': self.ex_api.milliseconds(),
+            'symbol': self.symbol,
+            'side': side,
+            'amount': amount,
+            'price': float(price['end_price'])*(config.buy_price_mult if side == 'buy' else config.sell_price_mult),
+            'trace': tracing.stamp(dict(traced_trade['trace']) if traced_trade else None,
+                                   'decided', self.ex_api.milliseconds()),
+        }
 
     def run(self):
         errors_count = 0
-        while True:
+        while not self.stopped.is_set():
             try:
                 self.target_user_trades_fetched.wait()
 
@@ -224,55 +395,9 @@ class Analyzer(threading.Thread):
                 if not target_user_trades_list:
                     continue
 
-                total_amount_buy = math.fsum([trade['amount']
-                                              for trade
-                                              in target_user_trades_list
-                                              if trade['side'] == 'buy'])
-
-                total_amount_sell = math.fsum([trade['amount']
-                                               for trade
-                                               in target_user_trades_list
-                                               if trade['side'] == 'sell'])
-
-                weighted_price_buy = math.fsum([trade['amount']*trade['price']/total_amount_buy
-                                                for trade
-                                                in target_user_trades_list
-                                                if trade['side'] == 'buy'])
-
-                weighted_price_sell = math.fsum([trade['amount']*trade['price']/total_amount_sell
-                                                 for trade
-                                                 in target_user_trades_list
-                                                 if trade['side'] == 'sell'])
-
-                if (total_amount_buy and total_amount_sell) and math.fabs(1-(total_amount_buy/total_amount_sell)) < 0.2:
-                    console.log('{:20}: {}'.format('Analyzer\'s idea', 'Fast buy/sell combination.'), n=1)
-                    continue
-
-                if total_amount_buy > total_amount_sell:
-                    amount = (total_amount_buy - total_amount_sell) * config.order_amount_mult
-                    price = self.ex_api.get_market_price(side='buy', symbol=config.target_pair, amount=amount)
-                    command = {
-                        'command_type': 'create_order',
-                        'timestamp': self.ex_api.milliseconds(),
-                        'symbol': config.target_pair,
-                        'side': 'buy',
-                        'amount': amount,
-                        'price': float(price['end_price'])*config.buy_price_mult
-                    }
-                    trader_commands.put(command)
-                    console_log_order('Analyzer\'s idea', command)
-                else:
-                    amount = (total_amount_sell - total_amount_buy) * config.order_amount_mult
-                    price = self.ex_api.get_market_price(side='sell', symbol=config.target_pair, amount=amount)
-                    command = {
-                        'command_type': 'create_order',
-                        'timestamp': self.ex_api.milliseconds(),
-                        'symbol': config.target_pair,
-                        'side': 'sell',
-                        'amount': amount,
-                        'price': float(price['end_price'])*config.sell_price_mult
-                    }
-                    trader_commands.put(command)
+                command = self.process_trades(target_user_trades_list)
+                if command:
+                    self.trader_commands.put(command)
                     console_log_order('Analyzer\'s idea', command)
 
                 errors_count = 0
@@ -280,15 +405,20 @@ class Analyzer(threading.Thread):
                 break
             except SystemExit:
                 raise
+            except CircuitOpenError as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                time.sleep(min(e.retry_after, 5))
             except Exception as e:
                 if DEBUG:
                     raise
-                console.log('{:20}: {}'.format('Analyzer', str(e)), is_ok=0)
-                telebot.log('{:20}: {}'.format('Analyzer', str(e)))
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
                 errors_count += 1
                 if errors_count > 10:
-                    console.log('{:20}: {}'.format('Analyzer', 'Too many errors. Stopping'), is_ok=0)
-                    telebot.log('{:20}: {}'.format('Analyzer', 'Too many errors. Stopping'))
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
                     break
                 else:
                     time.sleep(1)
@@ -297,107 +427,357 @@ class Analyzer(threading.Thread):
 
 
 class Trader(threading.Thread):
-    def __init__(self, ex_api):
-        super(Trader, self).__init__()
+    def __init__(self, ex_api, symbol, trader_commands, journal=None, stopped=None):
+        super(Trader, self).__init__(name='Trader {}'.format(symbol))
         self.daemon = True
+        self.stopped = stopped or threading.Event()
         self.config = config
         self.ex_api = ex_api
+        self.symbol = symbol
+        self.trader_commands = trader_commands
+        self.journal = journal
         self.orders = {}
 
+    def restore_orders(self):
+        started = time.time()
+        self.orders = self.journal.load()
+        console.log('{:20}: {}'.format(self.name, 'Restored {} orders in {:.1f}ms'.format(
+            len(self.orders), (time.time() - started) * 1000)))
+        if self.orders:
+            telebot.log('{:20}: {}'.format(self.name, 'Restored {} orders'.format(len(self.orders))))
+
+    def place_order(self, command):
+        resp = self.ex_api.create_order(side=command['side'], symbol=command['symbol'],
+                                        amount=command['amount'], price=command['price'])
+        if command.get('trace'):
+            trace_log.record(tracing.stamp(command['trace'], 'placed', self.ex_api.milliseconds()))
+        if resp['status'] is True:
+            order = order_state.TrackedOrder(order_id=resp['order_id'], command=command)
+            self.orders[order.order_id] = order
+            if self.journal:
+                self.journal.put(order)
+            console_log_order('NEW order', command)
+        else:
+            console.log('{:20}: {}'.format(self.name, 'Failed to create order.'), is_ok=0)
+
+    def check_order_state(self, order):
+        resp = self.ex_api.check_order(order_id=order.order_id)
+        if resp['status'] == 'processed':
+            return order_state.FILLED
+        elif resp['status'] == 'processing':
+            return order_state.OPEN
+        else:
+            return order_state.CANCELLED
+
+    @staticmethod
+    def closed_state(resp):
+        # True is a successful remove, any other status but 'processing' is an order that already left the book
+        status = resp.get('status')
+        if status == 'processed':
+            return order_state.FILLED
+        elif status is True or (isinstance(status, str) and status != 'processing'):
+            return order_state.CANCELLED
+        return None
+
+    def remove_order(self, order):
+        resp = self.ex_api.delete_order(symbol=order.symbol, order_id=order.order_id)
+        state = self.closed_state(resp)
+        if state is None:
+            # The remove failed, the order is only gone if the exchange says so
+            state = self.closed_state(self.ex_api.check_order(order_id=order.order_id))
+        return state
+
+    def set_order_state(self, order, state, remaining=None):
+        if state in (order_state.OPEN, order_state.PARTIALLY_FILLED):
+            changed = order.update_open(remaining if remaining is not None else order.remaining)
+        else:
+            changed = order.transit(state)
+
+        if changed and order.state == order_state.PARTIALLY_FILLED:
+            console_log_order('PART order', order.command)
+        elif changed and order.state == order_state.FILLED:
+            console_log_order('FIN order', order.command, color='green')
+            telegram_log_order('FIN order', order.command)
+        elif changed and order.state == order_state.CANCELLED:
+            console_log_order('CXL order', order.command, color='red')
+            telegram_log_order('CXL order', order.command)
+        elif changed and order.state == order_state.EXPIRED:
+            console_log_order('DEL order', order.command, color='red')
+            telegram_log_order('DEL order', order.command)
+
+        if order.is_final():
+            del self.orders[order.order_id]
+            if self.journal:
+                self.journal.delete(order.order_id)
+        elif changed and self.journal:
+            self.journal.put(order)
+
+    def cancel_orders(self, command):
+        for order in [order for order in self.orders.values() if order.symbol == command['symbol']]:
+            if command.get('order_id') and order.order_id != str(command['order_id']):
+                continue
+            state = self.remove_order(order)
+            if state is None:
+                console.log('{:20}: {}'.format(self.name, 'Failed to cancel order {}'.format(order.order_id)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, 'Failed to cancel order {}'.format(order.order_id)))
+            else:
+                self.set_order_state(order, state)
+
+    def reconcile_orders(self):
+        for symbol in set(order.symbol for order in self.orders.values()):
+            # One bulk request per pair, per-order status requests only for orders that left the open list
+            open_orders = self.ex_api.fetch_open_orders(symbol=symbol)
+            for order in [order for order in self.orders.values() if order.symbol == symbol]:
+                if open_orders is not None and order.order_id in open_orders:
+                    self.set_order_state(order, order_state.OPEN, remaining=open_orders[order.order_id])
+                else:
+                    self.set_order_state(order, self.check_order_state(order))
+
+        for order in list(self.orders.values()):
+            if (self.ex_api.milliseconds()-order.timestamp) > self.config.max_order_age*1000:
+                state = self.remove_order(order)
+                if state is None:
+                    console.log('{:20}: {}'.format(self.name, 'Failed to delete order {}, retrying'.format(
+                        order.order_id)), is_ok=0)
+                elif state == order_state.FILLED:
+                    self.set_order_state(order, order_state.FILLED)
+                else:
+                    self.set_order_state(order, order_state.EXPIRED)
+
     def run(self):
+        if self.journal:
+            # Orders left by a previous run are reconciled against the exchange on the first pass of the loop
+            try:
+                self.restore_orders()
+            except Exception as e:
+                if DEBUG:
+                    raise
+                # Trading with an empty book would leave the restored orders unmanaged on the exchange,
+                # so the whole pipeline stops instead of queuing orders nobody places
+                self.stopped.set()
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, 'Failed to restore orders: {}. Stopping'.format(e)),
+                            is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, 'Failed to restore orders: {}. Stopping'.format(e)))
+                return
         errors_count = 0
-        while True:
+        while not self.stopped.is_set():
             try:
                 try:
-                    command = trader_commands.get(timeout=5)
+                    command = self.trader_commands.get(timeout=5)
+                    tracing.stamp(command.get('trace'), 'dequeued', self.ex_api.milliseconds())
                 except queue.Empty:
                     command = None
 
-                if command and command['command_type'] == 'create_order':
-                    resp = self.ex_api.create_order(side=command['side'], symbol=command['symbol'],
-                                                    amount=command['amount'], price=command['price'])
-                    if resp['status'] is True:
-                        self.orders[resp['order_id']] = command
-                        console_log_order('NEW order', command)
-                    else:
-                        console.log('{:20}: {}'.format('Trader', 'Failed to create order.'), is_ok=0)
-
-                for order_id in list(self.orders.keys()):
-                    order = self.orders[order_id]
-                    resp = self.ex_api.check_order(order_id=order_id)
-                    if resp['status'] == 'processed':
-                        del self.orders[order_id]
-                        console_log_order('FIN order', order, color='green')
-                        telegram_log_order('FIN order', order)
-                    elif (self.ex_api.milliseconds()-order['timestamp']) > self.config.max_order_age*1000:
-                        console_log_order('DEL order', order, color='red')
-                        telegram_log_order('DEL order', order)
-                        self.ex_api.delete_order(symbol=order['symbol'], order_id=order_id)
+                if command and command['command_type'] == 'cancel_order':
+                    self.cancel_orders(command)
+                elif command and command['command_type'] == 'create_order':
+                    self.place_order(command)
+
+                self.reconcile_orders()
+
+                errors_count = 0
+            except KeyboardInterrupt:
+                break
+            except SystemExit:
+                raise
+            except CircuitOpenError as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                time.sleep(min(e.retry_after, 5))
+            except Exception as e:
+                if DEBUG:
+                    raise
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
+                errors_count += 1
+                if errors_count > 10:
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
+                    break
+                else:
+                    time.sleep(1)
+
+
+class OrderBookWatcher(threading.Thread):
+    def __init__(self, ex_api, order_book, stopped=None):
+        super(OrderBookWatcher, self).__init__(name='OrderBookWatcher {}'.format(order_book.symbol))
+        self.daemon = True
+        self.stopped = stopped or threading.Event()
+        self.ex_api = ex_api
+        self.order_book = order_book
 
+    def run(self):
+        schedule = PollScheduler.from_config(config.order_book_poll, default_interval=2)
+        errors_count = 0
+        while not self.stopped.is_set():
+            try:
+                self.order_book.update(self.ex_api.fetch_order_book(symbol=self.order_book.symbol))
+                schedule.wait()
                 errors_count = 0
             except KeyboardInterrupt:
                 break
             except SystemExit:
                 raise
+            except CircuitOpenError as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                time.sleep(min(e.retry_after, 5))
             except Exception as e:
                 if DEBUG:
                     raise
-                console.log('{:20}: {}'.format('Trader', str(e)), is_ok=0)
-                telebot.log('{:20}: {}'.format('Trader', str(e)))
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
                 errors_count += 1
                 if errors_count > 10:
-                    console.log('{:20}: {}'.format('Trader', 'Too many errors. Stopping'), is_ok=0)
-                    telebot.log('{:20}: {}'.format('Trader', 'Too many errors. Stopping'))
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
                     break
                 else:
                     time.sleep(1)
 
 
 class MarketPriceWatcher(threading.Thread):
-    def __init__(self, ex_api):
-        super(MarketPriceWatcher, self).__init__()
+    def __init__(self, ex_api, symbol, stopped=None):
+        super(MarketPriceWatcher, self).__init__(name='PriceWatcher {}'.format(symbol))
         self.daemon = True
+        self.stopped = stopped or threading.Event()
         self.ex_api = ex_api
+        self.symbol = symbol
 
     def run(self):
+        schedule = PollScheduler.from_config(config.market_price_poll, default_interval=3)
         errors_count = 0
-        while True:
+        while not self.stopped.is_set():
             try:
-                price_buy = self.ex_api.get_market_price(side='buy', symbol=config.target_pair,
-                                                         amount=1.0)['got_sum']
-                price_sell = self.ex_api.get_market_price(side='sell', symbol=config.target_pair,
-                                                          amount=1.0)['cost_sum']
+                price_buy = get_market_price(side='buy', symbol=self.symbol, amount=1.0)['got_sum']
+                price_sell = get_market_price(side='sell', symbol=self.symbol, amount=1.0)['cost_sum']
 
+                cache_stats = quote_cache.stats()
                 console.log('{:20}: {}'.format(
-                    'Market prices', '[BUY: {:.8f}    SELL: {:.8f}]'.format(float(price_buy)/1.0,
-                                                                            float(price_sell)/1.0)))
+                    'Market prices {}'.format(self.symbol),
+                    '[BUY: {:.8f}    SELL: {:.8f}    CACHE HITS: {:.0%} ({}/{})]'.format(
+                        float(price_buy)/1.0, float(price_sell)/1.0, cache_stats['hit_ratio'],
+                        cache_stats['hits'] + cache_stats['coalesced'], cache_stats['misses'])))
 
-                while True:
-                    now = datetime.now()
-                    if now.second != 0 and now.second % 3 == 0:
-                        break
-                    else:
-                        time.sleep(0.5)
+                schedule.wait()
                 errors_count = 0
             except KeyboardInterrupt:
                 break
             except SystemExit:
                 raise
+            except CircuitOpenError as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                time.sleep(min(e.retry_after, 5))
             except Exception as e:
                 if DEBUG:
                     raise
-                console.log('{:20}: {}'.format('PriceWatcher', str(e)), is_ok=0)
-                telebot.log('{:20}: {}'.format('PriceWatcher', str(e)))
+                metrics.registry.counter('autotrader_worker_errors_total', 'Errors caught by worker threads',
+                                         worker=self.name).inc()
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
                 errors_count += 1
                 if errors_count > 10:
-                    console.log('{:20}: {}'.format('PriceWatcher', 'Too many errors. Stopping'), is_ok=0)
-                    telebot.log('{:20}: {}'.format('PriceWatcher', 'Too many errors. Stopping'))
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
                     break
                 else:
                     time.sleep(1)
 
 
-exchange_api = BTCTradeUA(exchange_config=config.btctradeua)
+class Pipeline:
+    def __init__(self, ex_api, symbol):
+        self.symbol = symbol
+        self.target_user_trades = queue.Queue()
+        self.target_user_trades_fetched = threading.Event()
+        # Set once any component dies, the rest of the pair stops instead of trading half-blind
+        self.stopped = threading.Event()
+        self.trader_commands = CommandQueue(max_age=config.max_command_age or 30,
+                                            clock=ex_api.milliseconds, on_drop=self.drop_command)
+        self.order_book = order_books.setdefault(symbol, OrderBook(symbol=symbol))
+        self.journal = None
+        if config.order_journal_path:
+            self.journal = OrderJournal(file_name=pair_file_name(config.order_journal_path, symbol),
+                                        compact_every=config.order_journal_compact_every or 1000)
+        self.components = [
+            OrderBookWatcher(ex_api=ex_api, order_book=self.order_book, stopped=self.stopped),
+            Trader(ex_api=ex_api, symbol=symbol, trader_commands=self.trader_commands, journal=self.journal,
+                   stopped=self.stopped),
+            Analyzer(ex_api=ex_api, symbol=symbol,
+                     target_user_trades=self.target_user_trades,
+                     target_user_trades_fetched=self.target_user_trades_fetched,
+                     trader_commands=self.trader_commands, stopped=self.stopped),
+            TradeBookWatcher(ex_api=ex_api, symbol=symbol,
+                             target_user_trades=self.target_user_trades,
+                             target_user_trades_fetched=self.target_user_trades_fetched, stopped=self.stopped),
+            MarketPriceWatcher(ex_api=ex_api, symbol=symbol, stopped=self.stopped),
+        ]
+
+        for queue_name, pipeline_queue in (('target_user_trades', self.target_user_trades),
+                                           ('trader_commands', self.trader_commands)):
+            metrics.registry.gauge('autotrader_queue_depth', 'Items waiting in the pipeline queues',
+                                   func=pipeline_queue.qsize, pair=symbol, queue=queue_name)
+        metrics.registry.gauge('autotrader_commands_coalesced', 'Analyzer ideas netted into a queued order',
+                               func=lambda: self.trader_commands.coalesced_count, pair=symbol)
+
+    def drop_command(self, command):
+        metrics.registry.counter('autotrader_commands_dropped_total', 'Trader commands dropped before execution',
+                                 pair=self.symbol, reason='stale').inc()
+        console_log_order('Stale command', command, color='red')
+
+    def start(self):
+        for component in self.components:
+            component.start()
+
+    def stop(self):
+        self.stopped.set()
+        # Wakes the Analyzer, so it sees the stop instead of waiting for trades that never come
+        self.target_user_trades_fetched.set()
+
+    def is_alive(self):
+        return all(component.is_alive() for component in self.components)
+
+
+def observe_stage_latencies(latencies):
+    for stage, latency in latencies.items():
+        metrics.registry.histogram('autotrader_stage_seconds', 'Tick-to-trade stage latency',
+                                   stage=stage).observe(latency)
+
+
+def create_app(app_config=None, ex_api=None, market_price=None):
+    global config, console, telebot, exchange_api, quote_cache, price_source, trace_log
+    config = app_config or load_config()
+    console = Console(log_file_name=config.log_file_path,
+                      **(config.log_writer.to_dict() if config.log_writer else {}))
+    telebot = Telegram(config=config.telegram)
+    exchange_api = ex_api or BTCTradeUA(exchange_config=config.btctradeua, api_concurrency=config.api_concurrency,
+                                        retry_config=config.api_retry, breaker_config=config.api_breaker,
+                                        api_url=config.exchange_api_url, nonce_path=config.nonce_path)
+    quote_cache = QuoteCache(fetch=exchange_api.get_market_price,
+                             ttl=config.quote_cache_ttl or 1.0,
+                             max_size=config.quote_cache_size or 256)
+    for stat_name in ('hits', 'misses', 'coalesced', 'size'):
+        metrics.registry.gauge('autotrader_quote_cache', 'Quote cache counters',
+                               func=lambda stat_name=stat_name: quote_cache.stats()[stat_name], stat=stat_name)
+    # Backtests price orders with their own source instead of the order book mirror and the quote cache
+    price_source = market_price
+    trace_log.close()
+    trace_log = tracing.TraceLog(file_name=config.trace_log_path, on_record=observe_stage_latencies)
+
+
+def get_market_price(side, symbol, amount):
+    if price_source:
+        return price_source(side=side, symbol=symbol, amount=amount)
+    # Quotes come from the local order book mirror while it is fresh, the exchange is asked otherwise
+    order_book = order_books.get(symbol)
+    if order_book and order_book.age() is not None and order_book.age() <= (config.max_order_book_age or 10):
+        quote = order_book.quote(side=side, amount=amount)
+        if quote:
+            return quote
+    return quote_cache.get(side=side, symbol=symbol, amount=amount)
 
 
 def telegram_get_market_prices(bot, update):
@@ -409,10 +789,8 @@ def telegram_get_market_prices(bot, update):
                          text='<b>Wrong command format. Try this:</b><pre>/prices amount pair</pre>')
         return
 
-    price_buy = float(exchange_api.get_market_price(side='buy', symbol=symbol,
-                                                    amount=amount)['got_sum'])/amount
-    price_sell = float(exchange_api.get_market_price(side='sell', symbol=symbol,
-                                                     amount=amount)['cost_sum'])/amount
+    price_buy = float(get_market_price(side='buy', symbol=symbol, amount=amount)['got_sum'])/amount
+    price_sell = float(get_market_price(side='sell', symbol=symbol, amount=amount)['cost_sum'])/amount
 
     bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
                      text='<b>Market prices ({:.4f} {}):</b><pre>BUY: {:.8f}\nSELL: {:.8f}</pre>'
@@ -433,18 +811,23 @@ def telegram_create_buy_order(bot, update):
                          text='<b>Wrong command format. Try this:</b><pre>/buy amount pair [price]</pre>')
         return
 
+    if symbol not in pipelines:
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                         text='<b>Unknown pair. Available pairs:</b><pre>{}</pre>'.format(', '.join(pipelines)))
+        return
+
     if not price:
-        price = float(exchange_api.get_market_price(side='buy', symbol=config.target_pair, amount=amount)['end_price'])
+        price = float(get_market_price(side='buy', symbol=symbol, amount=amount)['end_price'])
 
     order = {
         'command_type': 'create_order',
         'timestamp': exchange_api.milliseconds(),
-        'symbol': config.target_pair,
+        'symbol': symbol,
         'side': 'buy',
         'amount': amount,
         'price': price
     }
-    trader_commands.put(order)
+    pipelines[symbol].trader_commands.put(order)
 
 
 def telegram_create_sell_order(bot, update):
@@ -461,54 +844,108 @@ def telegram_create_sell_order(bot, update):
                          text='<b>Wrong command format. Try this:</b><pre>/sell amount pair [price]</pre>')
         return
 
+    if symbol not in pipelines:
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                         text='<b>Unknown pair. Available pairs:</b><pre>{}</pre>'.format(', '.join(pipelines)))
+        return
+
     if not price:
-        price = float(exchange_api.get_market_price(side='sell', symbol=config.target_pair, amount=amount)['end_price'])
+        price = float(get_market_price(side='sell', symbol=symbol, amount=amount)['end_price'])
 
     order = {
         'command_type': 'create_order',
         'timestamp': exchange_api.milliseconds(),
-        'symbol': config.target_pair,
+        'symbol': symbol,
         'side': 'sell',
         'amount': amount,
         'price': price
     }
-    trader_commands.put(order)
+    pipelines[symbol].trader_commands.put(order)
 
 
-def main():
-    try:
-        console.log('Starting...')
-        target_user_trades = queue.Queue()
-        target_user_trades_fetched = threading.Event()
+def telegram_cancel_orders(bot, update):
+    cmd_line = update.message.text.split(' ')
+    if len(cmd_line) not in (2, 3):
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                         text='<b>Wrong command format. Try this:</b><pre>/cancel pair [order_id]</pre>')
+        return
+    symbol = str(cmd_line[1]).upper()
 
-        trader = Trader(ex_api=exchange_api)
-        trader.start()
+    if symbol not in pipelines:
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                         text='<b>Unknown pair. Available pairs:</b><pre>{}</pre>'.format(', '.join(pipelines)))
+        return
+
+    pipelines[symbol].trader_commands.put({
+        'command_type': 'cancel_order',
+        'timestamp': exchange_api.milliseconds(),
+        'symbol': symbol,
+        'order_id': cmd_line[2] if len(cmd_line) == 3 else None,
+    })
 
-        analyzer = Analyzer(ex_api=exchange_api,
-                            target_user_trades=target_user_trades,
-                            target_user_trades_fetched=target_user_trades_fetched)
-        analyzer.start()
 
-        trade_book_loader = TradeBookWatcher(ex_api=exchange_api,
-                                             target_user_trades=target_user_trades,
-                                             target_user_trades_fetched=target_user_trades_fetched)
-        trade_book_loader.start()
+def telegram_get_stats(bot, update):
+    msg = '<pre>'
+    msg += '{:18} {:>6} {:>7} {:>7} {:>5}\n'.format('ENDPOINT', 'COUNT', 'P50', 'P99', 'ERR')
+    errors = {}
+    for labels, counter in metrics.registry.collect('btctradeua_errors_total'):
+        errors[labels['endpoint']] = errors.get(labels['endpoint'], 0) + counter.value
+    for labels, histogram in metrics.registry.collect('btctradeua_request_seconds'):
+        msg += '{:18} {:>6} {:>6.3f}s {:>6.3f}s {:>5.0f}\n'.format(
+            labels['endpoint'][:18], histogram.count, histogram.quantile(0.5) or 0.0,
+            histogram.quantile(0.99) or 0.0, errors.get(labels['endpoint'], 0))
+    for labels, histogram in metrics.registry.collect('btctradeua_slot_wait_seconds'):
+        msg += 'SLOT WAIT {:8} p50: {:.3f}s p99: {:.3f}s\n'.format(
+            labels['group'], histogram.quantile(0.5) or 0.0, histogram.quantile(0.99) or 0.0)
+    for labels, gauge in metrics.registry.collect('autotrader_queue_depth'):
+        msg += 'QUEUE {:8} {:18} {}\n'.format(labels['pair'], labels['queue'], gauge.get())
+    for symbol, pipeline in pipelines.items():
+        msg += 'COMMANDS {:8} dropped: {} coalesced: {}\n'.format(
+            symbol, pipeline.trader_commands.dropped_count, pipeline.trader_commands.coalesced_count)
+    cache_stats = quote_cache.stats()
+    msg += 'QUOTE CACHE hits: {:.0%}\n'.format(cache_stats['hit_ratio'])
+    msg += 'TICK-TO-TRADE\n{}'.format(trace_log.report() or 'no trades yet')
+    msg += '</pre>'
+    bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
 
-        market_price_watcher = MarketPriceWatcher(ex_api=exchange_api)
-        market_price_watcher.start()
 
+def main():
+    if config is None:
+        create_app()
+    try:
+        console.log('Starting...')
+        if config.metrics:
+            metrics.MetricsServer(host=config.metrics.host or '127.0.0.1', port=config.metrics.port or 9108).start()
+        try:
+            exchange_api.load_markets(file_name=config.markets_cache_path, ttl=config.markets_cache_ttl or 86400)
+        except Exception as e:
+            # The workers load the markets on their first request anyway
+            console.log('{:20}: {}'.format('Markets', str(e)), is_ok=0)
+        for symbol in config.target_pairs or [config.target_pair]:
+            pipelines[symbol] = Pipeline(ex_api=exchange_api, symbol=symbol)
+            pipelines[symbol].start()
+
+        import telegram.ext as telegram
         telebot.add_handler(telegram.CommandHandler(command='prices', callback=telegram_get_market_prices))
         telebot.add_handler(telegram.CommandHandler(command='buy', callback=telegram_create_buy_order))
         telebot.add_handler(telegram.CommandHandler(command='sell', callback=telegram_create_sell_order))
+        telebot.add_handler(telegram.CommandHandler(command='cancel', callback=telegram_cancel_orders))
+        telebot.add_handler(telegram.CommandHandler(command='stats', callback=telegram_get_stats))
         telebot.start()
 
         console.log('Ready!')
         try:
-            while trader.is_alive() \
-                    and analyzer.is_alive() \
-                    and trade_book_loader.is_alive() \
-                    and market_price_watcher.is_alive() \
-                    and telebot.is_alive():
+            stopped_pipelines = set()
+            while telebot.is_alive():
+                # A failed pipeline is stopped and reported once, the other pairs keep trading
+                for symbol, pipeline in pipelines.items():
+                    if symbol not in stopped_pipelines and not pipeline.is_alive():
+                        stopped_pipelines.add(symbol)
+                        pipeline.stop()
+                        console.log('{:20}: {}'.format('Pipeline {}'.format(symbol), 'Stopped'), is_ok=0)
+                        telebot.log('{:20}: {}'.format('Pipeline {}'.format(symbol), 'Stopped'))
+                if len(stopped_pipelines) == len(pipelines):
+                    break
                 time.sleep(5)
         except:
             telebot.stop()
@@ -521,6 +958,11 @@ def main():
         raise
     finally:
         console.log('', n=1)
+        for pipeline in pipelines.values():
+            if pipeline.journal:
+                pipeline.journal.close()
+        trace_log.close()
+        console.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,153 @@
+import queue
+import threading
+from time import time
+
+import autotrader
+import tracing
+from exchange_simulator import SimulatedExchange
+from utils import load_config, Config, Console
+from database import Postgres
+
+
+config = load_config()
+console = Console(log_file_name=config.log_file_path)
+cout = console.log
+
+
+class Backtest:
+    def __init__(self, db, exchange, date_from, date_to, poll_interval=10):
+        self.db = db
+        self.symbol = exchange.symbol
+        self.date_from = date_from
+        self.date_to = date_to
+        self.poll_interval = poll_interval
+        self.exchange = exchange
+        self.initial_balances = dict(self.exchange.balances)
+        self.analyzer = autotrader.Analyzer(ex_api=self.exchange, symbol=self.symbol,
+                                            target_user_trades=queue.Queue(),
+                                            target_user_trades_fetched=threading.Event(),
+                                            trader_commands=queue.Queue())
+        self.trader = autotrader.Trader(ex_api=self.exchange, symbol=self.symbol, trader_commands=queue.Queue())
+        self.trades_count = 0
+        self.target_trades_count = 0
+        self.decisions_count = 0
+        self.first_timestamp = None
+        self.last_price = None
+
+    def load_trades(self):
+        with open('sql/select_trades_range.sql', encoding='utf8') as sql_file:
+            sql = sql_file.read().replace('#trades#', config.schema.trades)
+        data = {'symbol': self.symbol, 'date_from': self.date_from, 'date_to': self.date_to}
+        for order_id, timestamp, user_name, side, amount, price in self.db.stream(sql, data):
+            yield {
+                'id': order_id,
+                'timestamp': timestamp,
+                'symbol': self.symbol,
+                'side': side,
+                'amount': amount,
+                'price': price,
+                'info': {'user': user_name},
+            }
+
+    def poll(self, now, trades):
+        self.exchange.now = now
+        target_trades = [trade
+                         for trade
+                         in trades
+                         if trade['info']['user'] in config.target_users_names
+                         and trade['amount'] >= config.min_mean_trade_amount]
+        self.target_trades_count += len(target_trades)
+
+        if target_trades:
+            for trade in target_trades:
+                trade['trace'] = {'exchange': trade['timestamp'], 'detected': now}
+            command = self.analyzer.process_trades(target_trades)
+            if command:
+                self.decisions_count += 1
+                tracing.stamp(command.get('trace'), 'dequeued', now)
+                self.trader.place_order(command)
+
+        if self.trader.orders:
+            self.trader.reconcile_orders()
+
+    def run(self):
+        poll_interval = int(self.poll_interval * 1000)
+        next_poll = None
+        batch = []
+        for trade in self.load_trades():
+            self.trades_count += 1
+            if next_poll is None:
+                self.first_timestamp = trade['timestamp']
+                next_poll = trade['timestamp'] + poll_interval
+            while trade['timestamp'] >= next_poll:
+                self.poll(next_poll, batch)
+                batch = []
+                # Nothing to do until the next trade, skip the idle polls
+                if not self.trader.orders and trade['timestamp'] >= next_poll + poll_interval:
+                    next_poll += (trade['timestamp'] - next_poll) // poll_interval * poll_interval
+                else:
+                    next_poll += poll_interval
+            self.exchange.on_trade(trade)
+            self.last_price = trade['price']
+            batch.append(trade)
+        if next_poll is not None:
+            self.poll(next_poll, batch)
+
+    def report(self, elapsed):
+        balances = self.exchange.balances
+        orders = list(self.exchange.orders.values())
+        filled_count = len([order for order in orders if order['status'] == 'processed'])
+        partial_count = len([order for order in orders if order['remaining'] < order['amount']
+                             and order['status'] != 'processed'])
+        start_value = self.initial_balances['base'] + self.initial_balances['trade'] * (self.last_price or 0.0)
+        end_value = balances['base'] + balances['trade'] * (self.last_price or 0.0)
+        replayed_time = 0.0
+        if self.first_timestamp is not None:
+            replayed_time = (self.exchange.now - self.first_timestamp) / 1000
+
+        cout('{:20}: {}'.format('Trades', '{} replayed, {} from target users'.format(
+            self.trades_count, self.target_trades_count)), n=1)
+        cout('{:20}: {}'.format('Decisions', '{} ({:.1f}/s)'.format(
+            self.decisions_count, self.decisions_count / elapsed if elapsed else 0.0)), n=1)
+        cout('{:20}: {}'.format('Orders', '{} placed, {} filled, {} partially filled, {} open'.format(
+            len(orders), filled_count, partial_count, len(self.exchange.open_orders()))), n=1)
+        cout('{:20}: {}'.format('Balances', '{:.8f} {}, {:.8f} {}'.format(
+            balances['trade'], self.symbol.split('/')[0], balances['base'], self.symbol.split('/')[1])), n=1)
+        cout('{:20}: {}'.format('PnL', '{:.8f} {} (marked at {:.8f})'.format(
+            end_value - start_value, self.symbol.split('/')[1], self.last_price or 0.0)), n=1)
+        cout('{:20}: {}'.format('Speed', '{:.1f}s of history in {:.1f}s ({:.0f}x), {:.0f} trades/s'.format(
+            replayed_time, elapsed, replayed_time / elapsed if elapsed else 0.0,
+            self.trades_count / elapsed if elapsed else 0.0)), n=1)
+        for line in autotrader.trace_log.report().split('\n'):
+            if line:
+                cout('{:20}: {}'.format('Tick-to-trade', line), n=1)
+
+
+def main():
+    # The real Analyzer and Trader run against the simulated exchange, their logs and notifications are muted
+    exchange = SimulatedExchange(symbol=config.symbol,
+                                 balances=config.initial_balances.to_dict() if config.initial_balances else {})
+    app_config = Config(config.to_dict())
+    app_config.log_file_path = None
+    app_config.trace_log_path = None
+    autotrader.create_app(app_config=app_config, ex_api=exchange, market_price=exchange.get_market_price)
+    autotrader.console.silent = True
+    autotrader.telebot.log_chat_id = None
+
+    db = Postgres(config=config.db)
+    try:
+        backtest = Backtest(db=db, exchange=exchange,
+                            date_from=config.date_from, date_to=config.date_to,
+                            poll_interval=config.poll_interval or 10)
+
+        cout('Replaying {} trades from {} to {}...'.format(config.symbol, config.date_from, config.date_to), n=1)
+        started = time()
+        backtest.run()
+        backtest.report(elapsed=time() - started)
+    finally:
+        db.destroy()
+        console.close()
+
+
+if __name__ == '__main__':
+    main()
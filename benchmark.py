@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import queue
+import random
+import threading
+import tracemalloc
+from time import perf_counter, strftime
+
+import autotrader
+import tracing
+from exchange_simulator import SimulatedExchange
+from trades_index import TradesIndex
+from utils import load_config, Config, Console
+
+DEFAULT_CONFIG_PATH = 'sample_configs/benchmark.json'
+
+config = load_config(default_config_path=DEFAULT_CONFIG_PATH)
+console = Console(log_file_name=config.log_file_path)
+cout = console.log
+
+DEFAULT_SIZES = (1000, 10000, 100000, 1000000)
+CHUNK_SIZE = 1000
+TRADE_BOOK_PAGE = 100
+ANALYZER_BATCH = 10
+SYMBOL = 'BTC/UAH'
+
+
+def synthetic_trades(count, seed=0, start_timestamp=1500000000000, target_share=0.2):
+    rnd = random.Random(seed)
+    target_users = list(config.target_users_names or ['target'])
+    min_amount = config.min_mean_trade_amount or 0.0
+    timestamp, price = start_timestamp, 100000.0
+    for index in range(count):
+        timestamp += rnd.randint(0, 2000)
+        price *= 1 + rnd.gauss(0, 0.001)
+        is_target = rnd.random() < target_share
+        yield {
+            'id': str(index + 1),
+            'timestamp': timestamp,
+            'symbol': SYMBOL,
+            'side': 'buy' if rnd.random() < 0.5 else 'sell',
+            'amount': min_amount * rnd.uniform(0.5, 2.0) if is_target else rnd.uniform(0.001, 1.0),
+            'price': price,
+            'info': {'user': rnd.choice(target_users) if is_target else 'user{}'.format(rnd.randint(1, 1000))},
+        }
+
+
+def chunks(events, size=CHUNK_SIZE):
+    chunk = []
+    for event in events:
+        chunk.append(event)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bench_trade_book_watcher():
+    exchange = SimulatedExchange(symbol=SYMBOL, balances={})
+    watcher = autotrader.TradeBookWatcher(ex_api=exchange, symbol=SYMBOL,
+                                          target_user_trades=queue.Queue(),
+                                          target_user_trades_fetched=threading.Event())
+    reported_trades = TradesIndex(retention=config.trades_index_retention or 3600)
+
+    def run_chunk(trades):
+        for index in range(0, len(trades), TRADE_BOOK_PAGE):
+            page = trades[index:index + TRADE_BOOK_PAGE]
+            exchange.now = page[-1]['timestamp']
+            watcher.process_trades(page, reported_trades)
+        # Nothing consumes the queue here, keep it from growing with the stream
+        watcher.target_user_trades = queue.Queue()
+
+    return run_chunk
+
+
+def bench_analyzer():
+    exchange = SimulatedExchange(symbol=SYMBOL, balances={})
+    analyzer = autotrader.Analyzer(ex_api=exchange, symbol=SYMBOL,
+                                   target_user_trades=queue.Queue(),
+                                   target_user_trades_fetched=threading.Event(),
+                                   trader_commands=queue.Queue())
+    autotrader.get_market_price = exchange.get_market_price
+
+    def run_chunk(trades):
+        for index in range(0, len(trades), ANALYZER_BATCH):
+            batch = trades[index:index + ANALYZER_BATCH]
+            for trade in batch:
+                exchange.on_trade(trade)
+            analyzer.process_trades(batch)
+
+    return run_chunk
+
+
+def bench_trader():
+    exchange = SimulatedExchange(symbol=SYMBOL, balances={})
+    trader = autotrader.Trader(ex_api=exchange, symbol=SYMBOL, trader_commands=queue.Queue())
+
+    def run_chunk(trades):
+        for trade in trades:
+            exchange.now = trade['timestamp']
+            trader.place_order({
+                'command_type': 'create_order',
+                'timestamp': trade['timestamp'],
+                'symbol': SYMBOL,
+                'side': 'sell' if trade['side'] == 'buy' else 'buy',
+                'amount': trade['amount'],
+                'price': trade['price'],
+                'trace': {'exchange': trade['timestamp'], 'detected': trade['timestamp'],
+                          'decided': trade['timestamp'], 'dequeued': trade['timestamp']},
+            })
+            exchange.on_trade(trade)
+        trader.reconcile_orders()
+        # Orders the trader no longer tracks are dropped, the simulated exchange stays as small as the live one
+        for order_id in [order_id for order_id in exchange.orders if order_id not in trader.orders]:
+            del exchange.orders[order_id]
+
+    return run_chunk
+
+
+def bench_console_log_order():
+    def run_chunk(trades):
+        for trade in trades:
+            autotrader.console_log_order('New trade ({})'.format(trade['info']['user']), trade, color='blue')
+
+    return run_chunk
+
+
+def bench_telegram_log_order():
+    def run_chunk(trades):
+        for trade in trades:
+            autotrader.telegram_log_order('New trade ({})'.format(trade['info']['user']), trade)
+
+    return run_chunk
+
+
+def bench_config():
+    raw_config = config.to_dict()
+
+    def run_chunk(trades):
+        for _ in trades:
+            Config(raw_config)
+
+    return run_chunk
+
+
+BENCHMARKS = {
+    'trade_book_watcher': bench_trade_book_watcher,
+    'analyzer': bench_analyzer,
+    'trader': bench_trader,
+    'console_log_order': bench_console_log_order,
+    'telegram_log_order': bench_telegram_log_order,
+    'config': bench_config,
+}
+
+
+def run_benchmark(name, size, measure_memory=False):
+    run_chunk = BENCHMARKS[name]()
+    autotrader.trace_log.close()
+    autotrader.trace_log = tracing.TraceLog()
+
+    if measure_memory:
+        tracemalloc.start()
+    chunk_latencies = []
+    elapsed = 0.0
+    # Trades are generated outside of the timed section, one chunk at a time
+    for chunk in chunks(synthetic_trades(size, seed=size)):
+        started = perf_counter()
+        run_chunk(chunk)
+        chunk_elapsed = perf_counter() - started
+        elapsed += chunk_elapsed
+        chunk_latencies.append(chunk_elapsed / len(chunk))
+    peak_memory = None
+    if measure_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    chunk_latencies.sort()
+    return {
+        'benchmark': name,
+        'size': size,
+        'elapsed': elapsed,
+        'ops_per_sec': size / elapsed if elapsed else None,
+        'latency_mean_us': elapsed / size * 1e6,
+        # Spread between chunks, a chunk mixes cheap and expensive events, so these are not per event percentiles
+        'chunk_mean_latency_p50_us': tracing.percentile(chunk_latencies, 0.5) * 1e6,
+        'chunk_mean_latency_p99_us': tracing.percentile(chunk_latencies, 0.99) * 1e6,
+        'peak_memory': peak_memory,
+    }
+
+
+def parse_list(value, convert=str):
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return [convert(item) for item in value]
+    return [convert(item) for item in str(value).split(',') if item]
+
+
+def load_results(file_name):
+    with open(file_name, encoding='utf8') as results_file:
+        return {(result['benchmark'], result['size']): result for result in json.load(results_file)['results']}
+
+
+def report(result, baseline=None):
+    line = '{:>8} trades {:12.0f} ops/s  mean {:9.2f}us  chunk mean p50 {:9.2f}us  p99 {:9.2f}us'.format(
+        result['size'], result['ops_per_sec'] or 0.0,
+        result['latency_mean_us'], result['chunk_mean_latency_p50_us'], result['chunk_mean_latency_p99_us'])
+    if result['peak_memory'] is not None:
+        line += '  peak {:8.2f}MB'.format(result['peak_memory'] / 2**20)
+    if baseline and baseline.get('ops_per_sec') and result['ops_per_sec']:
+        line += '  {:+6.1f}%'.format((result['ops_per_sec'] / baseline['ops_per_sec'] - 1) * 100)
+    cout('{:20}: {}'.format(result['benchmark'], line), n=1)
+
+
+def main():
+    # Exchange calls are served by the simulated exchange, logs and notifications are formatted but never sent
+    autotrader.create_app(app_config=config, ex_api=SimulatedExchange(symbol=SYMBOL, balances={}))
+    autotrader.console = Console(silent=True)
+    autotrader.telebot.log_chat_id = None
+
+    sizes = parse_list(config.sizes, int) or DEFAULT_SIZES
+    names = parse_list(config.benchmarks) or list(BENCHMARKS)
+    baseline = load_results(config.compare_with) if config.compare_with else {}
+    results_path = config.results_path or 'benchmark_results/{}.json'.format(strftime('%Y%m%d_%H%M%S'))
+
+    results = []
+    try:
+        for name in names:
+            if name not in BENCHMARKS:
+                cout('{:20}: {}'.format('Benchmark', 'Unknown benchmark {}'.format(name)), is_ok=0, n=1)
+                continue
+            for size in sizes:
+                result = run_benchmark(name, size)
+                if not config.skip_memory:
+                    # A separate pass, tracemalloc slows down the timed one too much
+                    result['peak_memory'] = run_benchmark(name, size, measure_memory=True)['peak_memory']
+                results.append(result)
+                report(result, baseline.get((name, size)))
+
+        if os.path.dirname(results_path):
+            os.makedirs(os.path.dirname(results_path), exist_ok=True)
+        with open(results_path, 'w', encoding='utf8') as results_file:
+            json.dump({
+                'started': strftime('%Y-%m-%d %H:%M:%S'),
+                'python': sys.version.split()[0],
+                'chunk_size': CHUNK_SIZE,
+                'results': results,
+            }, results_file, indent=2)
+        cout('{:20}: {}'.format('Results', results_path), n=1)
+    finally:
+        console.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import heapq
+import queue
+import threading
+from time import time, monotonic
+
+
+PRIORITIES = {
+    'cancel_order': 0,
+    'create_order': 1,
+}
+DEFAULT_PRIORITY = 1
+# Only these are dropped once their deadline passes, a late cancel is still worth sending
+EXPIRING_COMMANDS = ('create_order',)
+
+
+def now_ms():
+    return int(time() * 1000)
+
+
+class CommandQueue:
+    def __init__(self, max_age=30.0, clock=now_ms, on_drop=None, coalesce=True):
+        self.max_age = max_age
+        self.clock = clock
+        self.on_drop = on_drop
+        self.coalesce = coalesce
+        self.dropped_count = 0
+        self.coalesced_count = 0
+        self._heap = []
+        self._seq = 0
+        self._size = 0
+        # Pending Analyzer idea per pair, later ideas are netted into it while it waits
+        self._ideas = {}
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def qsize(self):
+        with self._not_empty:
+            return self._size
+
+    def deadline(self, command):
+        if command['command_type'] not in EXPIRING_COMMANDS or not self.max_age:
+            return None
+        return command['timestamp'] + self.max_age*1000
+
+    def put(self, command):
+        with self._not_empty:
+            if self.coalesce and command.get('source') == 'analyzer' and self._merge_idea(command):
+                self.coalesced_count += 1
+                return
+            entry = [PRIORITIES.get(command['command_type'], DEFAULT_PRIORITY), self._seq, command]
+            self._seq += 1
+            heapq.heappush(self._heap, entry)
+            self._size += 1
+            if command.get('source') == 'analyzer':
+                self._ideas[command['symbol']] = entry
+            self._not_empty.notify()
+
+    def _merge_idea(self, command):
+        entry = self._ideas.get(command['symbol'])
+        if entry is None:
+            return False
+        pending = entry[2]
+        sign = {'buy': 1, 'sell': -1}
+        net_amount = sign[pending['side']]*pending['amount'] + sign[command['side']]*command['amount']
+        if abs(net_amount) < 1e-12:
+            # The ideas cancel out, nothing is left to send
+            entry[2] = None
+            self._size -= 1
+            del self._ideas[command['symbol']]
+            return True
+
+        side = 'buy' if net_amount > 0 else 'sell'
+        if side == command['side']:
+            # The fresh idea wins, so do its price and deadline
+            pending['price'] = command['price']
+            pending['timestamp'] = command['timestamp']
+        pending['side'] = side
+        pending['amount'] = abs(net_amount)
+        if command.get('trace') and not pending.get('trace'):
+            pending['trace'] = command['trace']
+        return True
+
+    def get(self, timeout=None):
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._not_empty:
+            while True:
+                while self._heap:
+                    entry = heapq.heappop(self._heap)
+                    command = entry[2]
+                    if command is None:
+                        continue
+                    self._size -= 1
+                    if self._ideas.get(command['symbol']) is entry:
+                        del self._ideas[command['symbol']]
+                    command_deadline = self.deadline(command)
+                    if command_deadline is not None and self.clock() > command_deadline:
+                        self.dropped_count += 1
+                        if self.on_drop:
+                            self.on_drop(command)
+                        continue
+                    return command
+
+                remaining = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._not_empty.wait(remaining)
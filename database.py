@@ -1,4 +1,5 @@
 import psycopg2
+import psycopg2.extras
 
 
 class Postgres:
@@ -48,3 +49,15 @@ class Postgres:
 
     def execute_nofetch(self, sql, data=None):
         self.cursor.execute(sql, data)
+
+    def execute_values(self, sql, rows, page_size=1000):
+        # All rows go in a few multi-row statements instead of a round trip per row
+        psycopg2.extras.execute_values(self.cursor, sql, rows, page_size=page_size)
+
+    def stream(self, sql, data=None, batch_size=10000):
+        # A named (server side) cursor keeps big result sets out of memory, rows are fetched in batches
+        with self.connection.cursor(name='stream_{}'.format(id(self))) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(sql, data)
+            for row in cursor:
+                yield row
@@ -0,0 +1,365 @@
+import re
+import json
+import random
+import threading
+from time import time, sleep, monotonic
+from collections import deque
+from datetime import datetime, timedelta
+from urllib.parse import parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils import load_config, Console
+
+
+DEFAULT_CONFIG_PATH = 'trading_configs/exchange_simulator.json'
+
+CYRILLIC_MONTHS = ('января', 'февраля', 'марта', 'апреля', 'мая', 'июня',
+                   'июля', 'августа', 'сентября', 'октября', 'ноября', 'декабря')
+
+
+def cyrillic_datetime(timestamp):
+    # btctradeua reports Kyiv local time in a russian date format, ccxt converts it back with the same DST rule
+    utc = datetime.utcfromtimestamp(timestamp / 1000)
+    month_day = utc.month * 100 + utc.day
+    local = utc + timedelta(hours=2 if month_day < 325 or month_day > 1028 else 3)
+    return '{} {} {} г. {}'.format(local.day, CYRILLIC_MONTHS[local.month - 1], local.year, local.strftime('%H:%M:%S'))
+
+
+class SimulatedExchange:
+    def __init__(self, symbol, balances):
+        self.symbol = symbol
+        self.now = 0
+        self.last_prices = {'buy': None, 'sell': None}
+        self.balances = {
+            'trade': float(balances.get(symbol.split('/')[0], 0.0)),
+            'base': float(balances.get(symbol.split('/')[1], 0.0)),
+        }
+        self.orders = {}
+        self._next_order_id = 1
+
+    def milliseconds(self):
+        return self.now
+
+    def open_orders(self):
+        return [order for order in self.orders.values() if order['status'] == 'processing']
+
+    def on_trade(self, trade):
+        self.now = max(self.now, trade['timestamp'])
+        self.last_prices[trade['side']] = trade['price']
+
+        # Resting orders fill at their own price against recorded trades that cross them, first come first served
+        liquidity = trade['amount']
+        for order in self.open_orders():
+            if liquidity <= 0:
+                break
+            if order['side'] == 'buy' and trade['price'] > order['price']:
+                continue
+            if order['side'] == 'sell' and trade['price'] < order['price']:
+                continue
+            amount = min(order['remaining'], liquidity)
+            liquidity -= amount
+            order['remaining'] -= amount
+            sign = 1 if order['side'] == 'buy' else -1
+            self.balances['trade'] += sign * amount
+            self.balances['base'] -= sign * amount * order['price']
+            if order['remaining'] <= 1e-12:
+                order['status'] = 'processed'
+
+    def create_order(self, side, symbol, amount, price):
+        order_id = str(self._next_order_id)
+        self._next_order_id += 1
+        self.orders[order_id] = {
+            'side': side,
+            'amount': amount,
+            'remaining': amount,
+            'price': price,
+            'status': 'processing',
+        }
+        return {'status': True, 'order_id': order_id}
+
+    def check_order(self, order_id):
+        return {'status': self.orders[str(order_id)]['status']}
+
+    def delete_order(self, symbol, order_id):
+        order = self.orders[str(order_id)]
+        if order['status'] == 'processing':
+            order['status'] = 'canceled'
+            return {'status': True}
+        return self.check_order(order_id)
+
+    def fetch_open_orders(self, symbol):
+        return {order_id: order['remaining']
+                for order_id, order
+                in self.orders.items()
+                if order['status'] == 'processing'}
+
+    def get_market_price(self, side, symbol, amount):
+        # There is no recorded order book, the last taker price of the side is used as its end price
+        price = self.last_prices[side] or self.last_prices['sell' if side == 'buy' else 'buy']
+        return {
+            'status': True,
+            'end_price': price,
+            'got_sum': price * amount,
+            'cost_sum': price * amount,
+        }
+
+
+class SimulatedPair:
+    def __init__(self, symbol, price, volatility=0.001, spread=0.002, depth=20):
+        self.symbol = symbol
+        self.price = price
+        self.volatility = volatility
+        self.spread = spread
+        self.depth = depth
+        self.exchange = SimulatedExchange(symbol=symbol, balances={})
+        self.deals = deque(maxlen=100)
+        self._next_deal_id = 1
+
+    def trade(self, user, side, amount):
+        self.price *= 1 + random.gauss(0, self.volatility)
+        price = self.price * (1 + self.spread / 2 if side == 'buy' else 1 - self.spread / 2)
+        timestamp = int(time() * 1000)
+        deal = {
+            'id': self._next_deal_id,
+            'type': side,
+            'user': user,
+            'price': '{:.8f}'.format(price),
+            'amnt_trade': '{:.8f}'.format(amount),
+            'amnt_base': '{:.8f}'.format(amount * price),
+            'pub_date': cyrillic_datetime(timestamp),
+        }
+        # The exchange lists every deal twice, once per side, and ccxt keeps only the odd ids
+        self._next_deal_id += 2
+        self.deals.appendleft(deal)
+        self.exchange.on_trade({'timestamp': timestamp, 'side': side, 'amount': amount, 'price': price})
+        return deal
+
+    def book_side(self, side):
+        # Synthetic levels around the mid price plus our own resting orders
+        sign = -1 if side == 'buy' else 1
+        levels = [(self.price * (1 + sign * (self.spread / 2 + index * self.spread / 4)), random.uniform(0.1, 5.0))
+                  for index in range(self.depth)]
+        levels += [(order['price'], order['remaining'])
+                   for order in self.exchange.open_orders()
+                   if order['side'] == side]
+        return sorted(levels, key=lambda level: -level[0] if side == 'buy' else level[0])
+
+    def quote(self, side, amount):
+        levels = self.book_side('sell' if side == 'buy' else 'buy')
+        remaining, total, end_price = amount, 0.0, None
+        for price, level_amount in levels:
+            filled = min(remaining, level_amount)
+            total += filled * price
+            remaining -= filled
+            end_price = price
+            if remaining <= 0:
+                break
+        return {
+            'status': True,
+            'end_price': '{:.8f}'.format(end_price),
+            'got_sum': '{:.8f}'.format(total),
+            'cost_sum': '{:.8f}'.format(total),
+        }
+
+
+class ExchangeSimulator:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.pairs = {}
+        for symbol, pair_config in (config.pairs.to_dict() if config.pairs else {'BTC/UAH': {}}).items():
+            self.pairs[symbol.replace('/', '_').lower()] = SimulatedPair(
+                symbol=symbol,
+                price=pair_config.get('price', 100000.0),
+                volatility=pair_config.get('volatility', 0.001),
+                spread=pair_config.get('spread', 0.002),
+            )
+        self.orders_pairs = {}
+        self.requests_count = 0
+        self.errors_count = 0
+        self.rate_limited_count = 0
+        self._rate_limit_tokens = float(self.rate_limit)
+        self._rate_limit_updated = monotonic()
+
+    @property
+    def rate_limit(self):
+        return self.config.rate_limit or 0
+
+    def take_rate_limit_token(self):
+        if not self.rate_limit:
+            return True
+        with self.lock:
+            now = monotonic()
+            self._rate_limit_tokens = min(self.rate_limit,
+                                          self._rate_limit_tokens + (now - self._rate_limit_updated) * self.rate_limit)
+            self._rate_limit_updated = now
+            if self._rate_limit_tokens < 1:
+                return False
+            self._rate_limit_tokens -= 1
+            return True
+
+    def pair(self, pair_id):
+        if pair_id not in self.pairs:
+            raise KeyError('Unknown pair {}'.format(pair_id))
+        return self.pairs[pair_id]
+
+    def handle(self, method, path, params):
+        path = re.sub('/+', '/', path).strip('/')
+        if path.startswith('api/'):
+            path = path[len('api/'):]
+        parts = path.split('/')
+
+        with self.lock:
+            if method == 'GET' and parts[0] == 'deals':
+                return list(self.pair(parts[1]).deals)
+            if method == 'GET' and parts[0] == 'trades' and parts[1] in ('buy', 'sell'):
+                levels = self.pair(parts[2]).book_side(parts[1])
+                return {
+                    'list': [{'price': '{:.8f}'.format(price),
+                              'currency_trade': '{:.8f}'.format(amount),
+                              'currency_base': '{:.8f}'.format(price * amount)}
+                             for price, amount in levels],
+                    'orders_sum': '{:.8f}'.format(sum(amount for _, amount in levels)),
+                }
+            if method != 'POST':
+                raise KeyError(path)
+
+            if parts[0] in ('buy', 'sell'):
+                pair = self.pair(parts[1])
+                resp = pair.exchange.create_order(side=parts[0], symbol=pair.symbol,
+                                                  amount=float(params['count']), price=float(params['price']))
+                self.orders_pairs[resp['order_id']] = parts[1]
+                return resp
+            if parts[0] == 'order' and parts[1] == 'status':
+                pair = self.pair(self.orders_pairs[parts[2]])
+                order = pair.exchange.orders[parts[2]]
+                return {'status': order['status'], 'id': parts[2], 'type': order['side'],
+                        'sum1': '{:.8f}'.format(order['amount']), 'price': '{:.8f}'.format(order['price'])}
+            if parts[0] == 'order' and parts[1] == 'remove':
+                return self.pair(parts[2]).exchange.delete_order(symbol=None, order_id=parts[3])
+            if parts[0] in ('ask', 'bid'):
+                return self.pair(parts[1]).quote(side='buy' if parts[0] == 'ask' else 'sell',
+                                                 amount=float(params.get('amount', 1.0)))
+            if parts[0] == 'my_orders':
+                pair = self.pair(parts[1])
+                return {
+                    'status': True,
+                    'your_open_orders': [{'id': order_id,
+                                          'type': order['side'],
+                                          'price': '{:.8f}'.format(order['price']),
+                                          'amnt_trade': '{:.8f}'.format(order['remaining']),
+                                          'amnt_base': '{:.8f}'.format(order['remaining'] * order['price'])}
+                                         for order_id, order in pair.exchange.orders.items()
+                                         if order['status'] == 'processing'],
+                }
+            if parts[0] in ('auth', 'balance'):
+                return {'status': True, 'accounts': []}
+        raise KeyError(path)
+
+
+class TradeFlowGenerator(threading.Thread):
+    def __init__(self, simulator, console):
+        super(TradeFlowGenerator, self).__init__(name='TradeFlowGenerator')
+        self.daemon = True
+        self.simulator = simulator
+        self.console = console
+
+    def run(self):
+        config = self.simulator.config
+        scripts = [user.to_dict() for user in (config.users or [])]
+        background = config.background_flow.to_dict() if config.background_flow else {}
+        next_runs = [monotonic() + random.uniform(0, script.get('interval', 30)) for script in scripts]
+        next_background = monotonic()
+        while True:
+            now = monotonic()
+            with self.simulator.lock:
+                if background.get('interval') and now >= next_background:
+                    for pair in self.simulator.pairs.values():
+                        pair.trade(user='user{}'.format(random.randint(1, 1000)), side=random.choice(('buy', 'sell')),
+                                   amount=random.uniform(background.get('min_amount', 0.01),
+                                                         background.get('max_amount', 1.0)))
+                    next_background = now + random.expovariate(1.0 / background['interval'])
+                for index, script in enumerate(scripts):
+                    if now < next_runs[index]:
+                        continue
+                    pair = self.simulator.pair(script['pair'].replace('/', '_').lower())
+                    side = script.get('side') or random.choice(('buy', 'sell'))
+                    deal = pair.trade(user=script['name'], side=side,
+                                      amount=random.uniform(script.get('min_amount', 100.0),
+                                                            script.get('max_amount', 1000.0)))
+                    self.console.log('{:20}: {}'.format('Target trade', '{} {} {} {} @ {}'.format(
+                        script['name'], pair.symbol, side, deal['amnt_trade'], deal['price'])), n=1)
+                    next_runs[index] = now + script.get('interval', 30)
+            sleep(0.05)
+
+
+def make_request_handler(simulator, console):
+    class SimulatorRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, method):
+            config = simulator.config
+            latency = config.latency.to_dict() if config.latency else {}
+            sleep(random.uniform(latency.get('min', 0.0), latency.get('max', 0.0)))
+            simulator.requests_count += 1
+
+            if not simulator.take_rate_limit_token():
+                simulator.rate_limited_count += 1
+                self._reply(429, {'status': False, 'error': 'Too many requests'})
+                return
+            if random.random() < (config.error_rate or 0.0):
+                simulator.errors_count += 1
+                self._reply(random.choice((500, 502, 503, 504)), {'status': False, 'error': 'Injected error'})
+                return
+
+            params = {}
+            if method == 'POST':
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode('utf8')
+                params = {key: values[-1] for key, values in parse_qs(body).items()}
+            try:
+                self._reply(200, simulator.handle(method, self.path.split('?')[0], params))
+            except KeyError as e:
+                self._reply(404, {'status': False, 'error': 'Not found: {}'.format(str(e))})
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, *args):
+            pass
+
+    return SimulatorRequestHandler
+
+
+def main():
+    config = load_config(default_config_path=DEFAULT_CONFIG_PATH)
+    console = Console(log_file_name=config.log_file_path)
+    simulator = ExchangeSimulator(config=config)
+    TradeFlowGenerator(simulator=simulator, console=console).start()
+
+    host, port = config.host or '127.0.0.1', config.port or 8090
+    server = ThreadingHTTPServer((host, port), make_request_handler(simulator, console))
+    console.log('Serving btctradeua simulator on http://{}:{}/api'.format(host, port), n=1)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        console.log('Requests: {}, injected errors: {}, rate limited: {}'.format(
+            simulator.requests_count, simulator.errors_count, simulator.rate_limited_count), n=1)
+        console.close()
+
+
+if __name__ == '__main__':
+    main()
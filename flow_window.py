@@ -0,0 +1,62 @@
+from collections import deque
+
+
+class CompensatedSum:
+    def __init__(self):
+        self.total = 0.0
+        self.compensation = 0.0
+
+    def add(self, value):
+        # Neumaier summation, keeps the running sum exact enough while values are added and removed
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+
+    def reset(self):
+        self.total = 0.0
+        self.compensation = 0.0
+
+    @property
+    def value(self):
+        return self.total + self.compensation
+
+
+class FlowWindow:
+    SIDES = ('buy', 'sell')
+
+    def __init__(self, window):
+        self.window = window
+        self._trades = deque()
+        self._amounts = {side: CompensatedSum() for side in self.SIDES}
+        self._costs = {side: CompensatedSum() for side in self.SIDES}
+
+    def __len__(self):
+        return len(self._trades)
+
+    def add(self, trade):
+        side, amount = trade['side'], trade['amount']
+        cost = amount * trade['price']
+        self._trades.append((trade['timestamp'], side, amount, cost))
+        self._amounts[side].add(amount)
+        self._costs[side].add(cost)
+
+    def evict(self, now):
+        min_timestamp = now - self.window*1000
+        while self._trades and self._trades[0][0] < min_timestamp:
+            _, side, amount, cost = self._trades.popleft()
+            self._amounts[side].add(-amount)
+            self._costs[side].add(-cost)
+        if not self._trades:
+            for side in self.SIDES:
+                self._amounts[side].reset()
+                self._costs[side].reset()
+
+    def amount(self, side):
+        return max(0.0, self._amounts[side].value)
+
+    def vwap(self, side):
+        amount = self.amount(side)
+        return self._costs[side].value / amount if amount else None
@@ -0,0 +1,72 @@
+import os
+import json
+import queue
+import threading
+from time import time
+from contextlib import contextmanager
+
+
+class NonceStore:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.marks = {}
+        self._lock = threading.Lock()
+        if os.path.isfile(file_name):
+            with open(file_name, encoding='utf8') as nonce_file:
+                self.marks = json.load(nonce_file)
+
+    def get(self, key):
+        with self._lock:
+            return self.marks.get(key, 0)
+
+    def save(self, key, mark):
+        with self._lock:
+            self.marks[key] = mark
+            tmp_file_name = self.file_name + '.tmp'
+            with open(tmp_file_name, 'w', encoding='utf8') as nonce_file:
+                json.dump(self.marks, nonce_file)
+                nonce_file.flush()
+                os.fsync(nonce_file.fileno())
+            os.replace(tmp_file_name, self.file_name)
+
+
+class MonotonicNonce:
+    def __init__(self, store=None, key=None, reserve=60000):
+        self.store = store
+        self.key = key
+        self.reserve = reserve
+        # A restart continues above every nonce the previous process may have sent, even if the clock stepped back
+        self.last = store.get(key) if store else 0
+        self._saved = self.last
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        # Millisecond based like before, but two calls in the same millisecond still get different nonces
+        with self._lock:
+            self.last = max(self.last + 1, int(time() * 1000))
+            if self.store and self.last > self._saved:
+                # Nonces up to the saved mark are reserved, so the file is written once per reserve, not per call
+                self._saved = self.last + self.reserve
+                self.store.save(self.key, self._saved)
+            return self.last
+
+
+class KeyPool:
+    def __init__(self, apis, slots_per_api=1):
+        self.apis = list(apis)
+        self.size = len(self.apis) * slots_per_api
+        self._free = queue.Queue()
+        for _ in range(slots_per_api):
+            for api in self.apis:
+                self._free.put(api)
+
+    def in_use(self):
+        return self.size - self._free.qsize()
+
+    @contextmanager
+    def acquire(self):
+        api = self._free.get()
+        try:
+            yield api
+        finally:
+            self._free.put(api)
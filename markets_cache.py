@@ -0,0 +1,31 @@
+import os
+import json
+from time import time
+
+
+def markets_file_name(file_name, exchange_name):
+    if not file_name:
+        return file_name
+    root, ext = os.path.splitext(file_name)
+    return '{}_{}{}'.format(root, exchange_name.lower(), ext)
+
+
+def load_markets(api, file_name=None, ttl=86400):
+    # Markets rarely change, a restart reads them from disk instead of waiting on the exchange
+    if file_name and os.path.isfile(file_name):
+        try:
+            with open(file_name, encoding='utf8') as markets_file:
+                cached = json.load(markets_file)
+            if time() - cached['timestamp'] < ttl:
+                api.set_markets(cached['markets'], cached.get('currencies'))
+                return api.markets
+        except (ValueError, KeyError):
+            pass
+
+    markets = api.load_markets()
+    if file_name:
+        tmp_file_name = file_name + '.tmp'
+        with open(tmp_file_name, 'w', encoding='utf8') as markets_file:
+            json.dump({'timestamp': time(), 'markets': api.markets, 'currencies': api.currencies}, markets_file)
+        os.replace(tmp_file_name, file_name)
+    return markets
@@ -0,0 +1,166 @@
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name, labels, self.value
+
+
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, func=None):
+        self.func = func
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+    def get(self):
+        return self.func() if self.func else self.value
+
+    def samples(self, name, labels):
+        yield name, labels, self.get()
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation, good enough to spot regressions
+        with self._lock:
+            counts, count = list(self.counts), self.count
+        if not count:
+            return None
+        rank, seen = q * count, 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return self.buckets[index] if index < len(self.buckets) else float('inf')
+        return float('inf')
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bucket, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            yield name + '_bucket', labels + (('le', '+Inf' if bucket == float('inf') else repr(bucket)),), cumulative
+        yield name + '_sum', labels, total
+        yield name + '_count', labels, count
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._families = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labels, **kwargs):
+        labels = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        metric = family[2].get(labels) if family else None
+        if metric is not None:
+            return metric
+        with self._lock:
+            family = self._families.setdefault(name, (cls.kind, help_text, OrderedDict()))
+            if family[0] != cls.kind:
+                raise ValueError('Metric {} is a {}, not a {}'.format(name, family[0], cls.kind))
+            return family[2].setdefault(labels, cls(**kwargs))
+
+    def counter(self, name, help_text='', **labels):
+        return self._get(Counter, name, help_text, labels)
+
+    def gauge(self, name, help_text='', func=None, **labels):
+        gauge = self._get(Gauge, name, help_text, labels)
+        if func:
+            gauge.func = func
+        return gauge
+
+    def histogram(self, name, help_text='', buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(Histogram, name, help_text, labels, buckets=buckets)
+
+    def collect(self, name):
+        family = self._families.get(name)
+        if not family:
+            return []
+        return [(dict(labels), metric) for labels, metric in list(family[2].items())]
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        return '{' + ','.join('{}="{}"'.format(key, str(val).replace('\\', '\\\\').replace('"', '\\"'))
+                              for key, val in labels) + '}'
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, metrics) in list(self._families.items()):
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            for labels, metric in list(metrics.items()):
+                for sample_name, sample_labels, value in metric.samples(name, labels):
+                    lines.append('{}{} {}'.format(sample_name, self._format_labels(sample_labels), repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+class MetricsServer(threading.Thread):
+    def __init__(self, metrics_registry=None, host='127.0.0.1', port=9108):
+        super(MetricsServer, self).__init__(name='MetricsServer')
+        self.daemon = True
+        metrics_registry = metrics_registry or registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics_registry.render().encode('utf8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
@@ -0,0 +1,75 @@
+import time
+from array import array
+from bisect import bisect_left
+
+
+class OrderBookSide:
+    def __init__(self, levels):
+        self.prices = array('d')
+        self.cum_amounts = array('d')
+        self.cum_costs = array('d')
+
+        total_amount, total_cost = 0.0, 0.0
+        for level in levels:
+            price, amount = float(level[0]), float(level[1])
+            if amount <= 0:
+                continue
+            total_amount += amount
+            total_cost += price * amount
+            self.prices.append(price)
+            self.cum_amounts.append(total_amount)
+            self.cum_costs.append(total_cost)
+
+    def __len__(self):
+        return len(self.prices)
+
+    def depth(self):
+        return self.cum_amounts[-1] if self.cum_amounts else 0.0
+
+    def quote(self, amount):
+        if amount <= 0 or not self.prices:
+            return None
+        index = bisect_left(self.cum_amounts, amount)
+        if index >= len(self.prices):
+            return None
+        prev_amount = self.cum_amounts[index-1] if index else 0.0
+        prev_cost = self.cum_costs[index-1] if index else 0.0
+        cost = prev_cost + (amount - prev_amount) * self.prices[index]
+        return self.prices[index], cost
+
+
+class OrderBook:
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.bids = OrderBookSide([])
+        self.asks = OrderBookSide([])
+        self.updated = None
+
+    def update(self, order_book):
+        # Sides are rebuilt aside and swapped in, readers always see a consistent side
+        self.bids = OrderBookSide(sorted(order_book['bids'], key=lambda level: -float(level[0])))
+        self.asks = OrderBookSide(sorted(order_book['asks'], key=lambda level: float(level[0])))
+        self.updated = time.monotonic()
+
+    def age(self):
+        if self.updated is None:
+            return None
+        return time.monotonic() - self.updated
+
+    def quote(self, side, amount):
+        if side == 'buy':
+            quote = self.asks.quote(amount)
+        elif side == 'sell':
+            quote = self.bids.quote(amount)
+        else:
+            quote = None
+        if not quote:
+            return None
+        end_price, cost = quote
+        return {
+            'status': True,
+            'end_price': end_price,
+            'got_sum': cost,
+            'cost_sum': cost,
+            'vwap': cost / amount,
+        }
@@ -0,0 +1,107 @@
+import os
+import json
+import threading
+
+from order_state import TrackedOrder
+
+
+class OrderJournal:
+    def __init__(self, file_name, compact_every=1000, fsync=True):
+        self.file_name = file_name
+        self.snapshot_file_name = '{}_snapshot.json'.format(os.path.splitext(file_name)[0])
+        self.compact_every = compact_every
+        self.fsync = fsync
+
+        self.seq = 0
+        self._orders = {}
+        self._records_count = 0
+        self._file = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        # Snapshot first, then every log record written after it. A torn last line is what a crash mid-write leaves
+        with self._lock:
+            self._orders = {}
+            snapshot_seq = 0
+            if os.path.isfile(self.snapshot_file_name):
+                with open(self.snapshot_file_name, encoding='utf8') as snapshot_file:
+                    snapshot = json.load(snapshot_file)
+                snapshot_seq = snapshot['seq']
+                self._orders = {order['order_id']: order for order in snapshot['orders']}
+            self.seq = snapshot_seq
+
+            self._records_count = 0
+            if os.path.isfile(self.file_name):
+                valid_size = 0
+                with open(self.file_name, 'rb') as log_file:
+                    for line in log_file:
+                        if not line.endswith(b'\n'):
+                            break
+                        try:
+                            record = json.loads(line.decode('utf8'))
+                        except ValueError:
+                            break
+                        valid_size += len(line)
+                        self._records_count += 1
+                        if record['seq'] > snapshot_seq:
+                            self._apply(record)
+                            self.seq = record['seq']
+                # New records must not be glued to the torn tail
+                if valid_size < os.path.getsize(self.file_name):
+                    with open(self.file_name, 'r+b') as log_file:
+                        log_file.truncate(valid_size)
+
+            self._file = open(self.file_name, 'a', encoding='utf8')
+            return {order_id: TrackedOrder.from_dict(order) for order_id, order in self._orders.items()}
+
+    def _apply(self, record):
+        if record['op'] == 'put':
+            self._orders[record['order']['order_id']] = record['order']
+        else:
+            self._orders.pop(record['order_id'], None)
+
+    def _append(self, record):
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.file_name, 'a', encoding='utf8')
+            self.seq += 1
+            record['seq'] = self.seq
+            self._apply(record)
+            self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self._records_count += 1
+            if self._records_count >= self.compact_every:
+                self._compact()
+
+    def put(self, order):
+        self._append({'op': 'put', 'order': order.to_dict()})
+
+    def delete(self, order_id):
+        self._append({'op': 'delete', 'order_id': str(order_id)})
+
+    def _compact(self):
+        # The snapshot replaces the old one atomically before the log is cut, records up to its seq are skipped
+        tmp_file_name = self.snapshot_file_name + '.tmp'
+        with open(tmp_file_name, 'w', encoding='utf8') as snapshot_file:
+            json.dump({'seq': self.seq, 'orders': list(self._orders.values())}, snapshot_file)
+            snapshot_file.flush()
+            if self.fsync:
+                os.fsync(snapshot_file.fileno())
+        os.replace(tmp_file_name, self.snapshot_file_name)
+
+        self._file.close()
+        self._file = open(self.file_name, 'w', encoding='utf8')
+        self._records_count = 0
+
+    def compact(self):
+        with self._lock:
+            if self._file is not None:
+                self._compact()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
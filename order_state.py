@@ -0,0 +1,74 @@
+NEW = 'new'
+OPEN = 'open'
+PARTIALLY_FILLED = 'partially_filled'
+FILLED = 'filled'
+CANCELLED = 'cancelled'
+EXPIRED = 'expired'
+
+FINAL_STATES = (FILLED, CANCELLED, EXPIRED)
+
+TRANSITIONS = {
+    NEW: (OPEN, PARTIALLY_FILLED, FILLED, CANCELLED, EXPIRED),
+    OPEN: (PARTIALLY_FILLED, FILLED, CANCELLED, EXPIRED),
+    PARTIALLY_FILLED: (FILLED, CANCELLED, EXPIRED),
+    FILLED: (),
+    CANCELLED: (),
+    EXPIRED: (),
+}
+
+
+class OrderStateError(Exception):
+    pass
+
+
+class TrackedOrder:
+    def __init__(self, order_id, command, state=NEW, remaining=None):
+        self.order_id = str(order_id)
+        self.command = command
+        self.state = state
+        self.remaining = command['amount'] if remaining is None else remaining
+
+    @property
+    def symbol(self):
+        return self.command['symbol']
+
+    @property
+    def timestamp(self):
+        return self.command['timestamp']
+
+    def is_final(self):
+        return self.state in FINAL_STATES
+
+    def transit(self, state, remaining=None):
+        if remaining is not None:
+            self.remaining = remaining
+        if state == self.state:
+            return False
+        if state not in TRANSITIONS[self.state]:
+            raise OrderStateError('Order {}: {} -> {} is not allowed'.format(self.order_id, self.state, state))
+        self.state = state
+        return True
+
+    def update_open(self, remaining):
+        # The exchange rounds amounts to 8 digits, so compare at that precision
+        if round(remaining, 8) >= round(self.command['amount'], 8) and self.state in (NEW, OPEN):
+            return self.transit(OPEN, remaining=remaining)
+        if self.state == PARTIALLY_FILLED and round(remaining, 8) == round(self.remaining, 8):
+            return False
+        self.remaining = remaining
+        if self.state == PARTIALLY_FILLED:
+            return True
+        return self.transit(PARTIALLY_FILLED)
+
+    def to_dict(self):
+        return {
+            'order_id': self.order_id,
+            'command': self.command,
+            'state': self.state,
+            'remaining': self.remaining,
+        }
+
+    @staticmethod
+    def from_dict(data):
+        return TrackedOrder(order_id=data['order_id'], command=data['command'],
+                            state=data['state'], remaining=data['remaining'])
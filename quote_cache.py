@@ -0,0 +1,93 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class QuoteCache:
+    SUM_KEYS = ('got_sum', 'cost_sum')
+
+    def __init__(self, fetch, ttl=1.0, max_size=256, amount_digits=3):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_size = max_size
+        self.amount_digits = amount_digits
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._quotes = OrderedDict()
+        self._flights = {}
+
+    def _key(self, side, symbol, amount):
+        return side, symbol, float('{:.{}g}'.format(amount, self.amount_digits))
+
+    def _scaled(self, quote, quote_amount, amount):
+        # Amounts inside a bucket differ slightly, so sums are rescaled to the requested amount
+        if quote_amount == amount or not isinstance(quote, dict):
+            return quote
+        quote = dict(quote)
+        for key in self.SUM_KEYS:
+            if key in quote:
+                quote[key] = float(quote[key]) * amount / quote_amount
+        return quote
+
+    def get(self, side, symbol, amount):
+        key = self._key(side, symbol, amount)
+        with self._lock:
+            cached = self._quotes.get(key)
+            if cached and time.monotonic() - cached[0] <= self.ttl:
+                self._quotes.move_to_end(key)
+                self.hits += 1
+                return self._scaled(cached[2], cached[1], amount)
+            flight = self._flights.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._flights[key] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return self._scaled(flight.result[1], flight.result[0], amount)
+
+        try:
+            quote = self.fetch(side=side, symbol=symbol, amount=amount)
+            flight.result = (amount, quote)
+            with self._lock:
+                self._quotes[key] = (time.monotonic(), amount, quote)
+                self._quotes.move_to_end(key)
+                while len(self._quotes) > self.max_size:
+                    self._quotes.popitem(last=False)
+            return quote
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+
+    def stats(self):
+        with self._lock:
+            requests = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'size': len(self._quotes),
+                'hit_ratio': (self.hits + self.coalesced) / requests if requests else 0.0,
+            }
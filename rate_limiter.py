@@ -0,0 +1,82 @@
+import heapq
+import threading
+from time import monotonic
+from contextlib import contextmanager
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKGROUND = 2
+
+
+class RateLimiter:
+    def __init__(self, name, rate, burst=1):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.busy = False
+        self.calls_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._updated = monotonic()
+        self._waiting = []
+        self._seq = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def queued(self):
+        with self._cond:
+            return len(self._waiting)
+
+    def acquire(self, priority=NORMAL):
+        started = monotonic()
+        with self._cond:
+            entry = (priority, self._seq)
+            self._seq += 1
+            heapq.heappush(self._waiting, entry)
+            # One request at a time per exchange, the most urgent waiter goes first once a token is there
+            while True:
+                if self._waiting[0] == entry and not self.busy:
+                    now = monotonic()
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        break
+                    self._cond.wait((1 - self.tokens) / self.rate)
+                else:
+                    self._cond.wait()
+            heapq.heappop(self._waiting)
+            self.tokens -= 1
+            self.busy = True
+
+            waited = monotonic() - started
+            self.calls_count += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+            return waited
+
+    def release(self):
+        with self._cond:
+            self.busy = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=NORMAL):
+        self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'rate': self.rate,
+                'queued': len(self._waiting),
+                'calls': self.calls_count,
+                'avg_wait': self.total_wait / self.calls_count if self.calls_count else 0.0,
+                'max_wait': self.max_wait,
+            }
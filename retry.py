@@ -0,0 +1,95 @@
+import time
+import random
+import threading
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        super(CircuitOpenError, self).__init__('{} circuit is open, retry in {:.1f}s'.format(name, retry_after))
+        self.name = name
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    def __init__(self, deadline=30.0, base_delay=0.25, max_delay=5.0, multiplier=2.0, jitter=0.5):
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    @staticmethod
+    def from_config(config):
+        if not config:
+            return RetryPolicy()
+        return RetryPolicy(
+            deadline=config.deadline or 30.0,
+            base_delay=config.base_delay or 0.25,
+            max_delay=config.max_delay or 5.0,
+            multiplier=config.multiplier or 2.0,
+            jitter=config.jitter if config.jitter is not None else 0.5,
+        )
+
+    def delay(self, attempt):
+        delay = min(self.max_delay, self.base_delay * self.multiplier**attempt)
+        return delay * random.uniform(1 - self.jitter, 1)
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=10.0, half_open_calls=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures_count = 0
+        self._opened_at = None
+        self._probes_count = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def from_config(name, config):
+        if not config:
+            return CircuitBreaker(name=name)
+        return CircuitBreaker(
+            name=name,
+            failure_threshold=config.failure_threshold or 5,
+            reset_timeout=config.reset_timeout or 10.0,
+            half_open_calls=config.half_open_calls or 1,
+        )
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                retry_after = self._opened_at + self.reset_timeout - time.monotonic()
+                if retry_after > 0:
+                    raise CircuitOpenError(self.name, retry_after)
+                self.state = self.HALF_OPEN
+                self._probes_count = 0
+            if self.state == self.HALF_OPEN:
+                # Only a few probe calls go through until one of them shows the endpoint is back
+                if self._probes_count >= self.half_open_calls:
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probes_count += 1
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures_count = 0
+
+    def record_error(self):
+        # The endpoint answered but refused the call, which proves nothing either way, so the probe is handed back
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probes_count:
+                self._probes_count -= 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failures_count += 1
+            if self.state == self.HALF_OPEN or self.failures_count >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
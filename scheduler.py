@@ -0,0 +1,65 @@
+import time
+import random
+import threading
+
+
+class PollScheduler:
+    def __init__(self, interval, min_interval=None, max_interval=None,
+                 jitter=0.1, speedup=0.5, backoff=1.5):
+        self.base_interval = interval
+        self.min_interval = min_interval or interval
+        self.max_interval = max_interval or interval
+        self.jitter = jitter
+        self.speedup = speedup
+        self.backoff = backoff
+        self.interval = interval
+        self._stopped = False
+        self._wake_event = threading.Event()
+        self._deadline = time.monotonic() + interval * random.uniform(1 - jitter, 1 + jitter)
+
+    @staticmethod
+    def from_config(config, default_interval):
+        if not config:
+            return PollScheduler(interval=default_interval)
+        return PollScheduler(
+            interval=config.interval or default_interval,
+            min_interval=config.min_interval,
+            max_interval=config.max_interval,
+            jitter=config.jitter if config.jitter is not None else 0.1,
+            speedup=config.speedup or 0.5,
+            backoff=config.backoff or 1.5,
+        )
+
+    def _next_deadline(self, now):
+        interval = self.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+        # Keep the cadence when on time, restart it when woken early or after a slow iteration
+        deadline = min(self._deadline, now) + interval
+        if deadline < now:
+            deadline = now + interval
+        return deadline
+
+    def wait(self):
+        timeout = self._deadline - time.monotonic()
+        if timeout > 0:
+            self._wake_event.wait(timeout)
+        self._wake_event.clear()
+        if self._stopped:
+            return False
+        self._deadline = self._next_deadline(time.monotonic())
+        return True
+
+    def wake(self):
+        self._wake_event.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wake_event.set()
+
+    def active(self):
+        self.interval = max(self.min_interval, self.interval * self.speedup)
+
+    def idle(self):
+        self.interval = min(self.max_interval, self.interval * self.backoff)
+
+    def reset(self):
+        self.interval = self.base_interval
@@ -1,29 +1,309 @@
+import time
 import threading
+from html import escape
+from time import monotonic
+from datetime import datetime, timedelta, timezone
 from traceback import format_exc
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 
-import ccxt
-import telegram.ext as telegram
-
-from utils import load_config, Console, Telegram
+from utils import load_config, Config, Console, Telegram
+from markets_cache import markets_file_name, load_markets
+from scheduler import PollScheduler
+from valuation import ConversionGraphCache
+from rate_limiter import RateLimiter, INTERACTIVE, NORMAL, BACKGROUND
 
 DEFAULT_CONFIG_PATH = 'trading_configs/slrx_fund.json'
+QUOTE_CURRENCIES = ('USD', 'BTC', 'UAH')
+
+# Exchange names used in the config and in commands, mapped to ccxt classes
+EXCHANGES = {
+    'bitstamp': 'bitstamp',
+    'binance': 'binance',
+    'bittrex': 'bittrex',
+    'cryptopia': 'cryptopia',
+    'hitbtc': 'hitbtc2',
+}
 
-config = load_config(default_config_path=DEFAULT_CONFIG_PATH)
-console = Console(log_file_name=config.log_file_path)
-telebot = Telegram(config=config.telegram)
+# Set up by create_app, importing the module needs neither a config nor credentials
+config = None
+console = Console()
+telebot = None
+balance_snapshots = None
+balance_recorder = None
 
 exchanges = {}
+conversion_graphs = None
+# Threads are only started on the first submit, a timed out fetch keeps its worker until the exchange answers
+fetcher = ThreadPoolExecutor(max_workers=2*len(EXCHANGES), thread_name_prefix='fetcher')
 
 
 class Exchange:
-    def __init__(self, api):
-        self._api = api
-        self._api.nonce = self._api.milliseconds
+    # ccxt methods that send requests, everything else (markets, has, parsers) is used directly
+    REQUEST_METHODS = ('fetch', 'create', 'cancel', 'edit', 'withdraw', 'load_markets')
+
+    def __init__(self, name, api_id, api_config, markets_cache_path=None, markets_cache_ttl=86400,
+                 rate_limit=None, burst=1):
+        self.name = name
+        self.api_id = api_id
+        self.api_config = api_config
+        self.markets_cache_path = markets_cache_path
+        self.markets_cache_ttl = markets_cache_ttl
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.limiter = None
+        self._api = None
         self.lock = threading.Lock()
 
+    @property
+    def api(self):
+        # ccxt and the markets are only loaded when the exchange is first used
+        if self._api is None:
+            with self.lock:
+                if self._api is None:
+                    import ccxt
+                    api = getattr(ccxt, self.api_id)(config=self.api_config)
+                    api.nonce = api.milliseconds
+                    # ccxt rateLimit is the minimal delay between requests in milliseconds
+                    self.limiter = RateLimiter(name=self.name, rate=1000 / (self.rate_limit or api.rateLimit),
+                                               burst=self.burst)
+                    load_markets(api, file_name=markets_file_name(self.markets_cache_path, self.name),
+                                 ttl=self.markets_cache_ttl)
+                    self._api = api
+        return self._api
+
+    def request(self, method, *args, priority=NORMAL, **kwargs):
+        # Every request waits for its turn and a token, so calls are serialized and paced to the venue's limits
+        api = self.api
+        with self.limiter.slot(priority):
+            return getattr(api, method)(*args, **kwargs)
+
     def __getattr__(self, item):
-        with self.lock:
-            return getattr(self._api, item)
+        attr = getattr(self.api, item)
+        if callable(attr) and item.startswith(self.REQUEST_METHODS):
+            return lambda *args, **kwargs: self.request(item, *args, **kwargs)
+        return attr
+
+
+def fetch_all(names, fetch):
+    # All exchanges are asked at once, the slowest healthy one bounds the wait
+    started = monotonic()
+    futures = {name: fetcher.submit(fetch, exchanges[name]) for name in names}
+    timeouts = config.balance_timeouts.to_dict() if config.balance_timeouts else {}
+    results, errors = {}, {}
+    for name, future in futures.items():
+        timeout = timeouts.get(name, config.balance_timeout or 10)
+        try:
+            results[name] = future.result(timeout=max(0.0, started + timeout - monotonic()))
+        except FutureTimeoutError:
+            errors[name] = 'timed out'
+        except Exception as e:
+            errors[name] = escape(str(e)[:100] or type(e).__name__)
+    return results, errors
+
+
+def fetch_balances(names, priority=NORMAL):
+    return fetch_all(names, lambda exchange: exchange.request('fetch_balance', priority=priority))
+
+
+def fetch_tickers():
+    # Exchanges without a bulk ticker endpoint are left out, their coins are priced by the other exchanges
+    return fetch_all(exchanges.keys(),
+                     lambda exchange: exchange.fetch_tickers() if exchange.has.get('fetchTickers') else {})
+
+
+class BalanceSnapshots(threading.Thread):
+    def __init__(self, interval=60):
+        super(BalanceSnapshots, self).__init__(name='BalanceSnapshots')
+        self.daemon = True
+        self.schedule = PollScheduler(interval=interval)
+        self.snapshots = {}
+        self.errors = {}
+        self._refresh_started = {}
+        # Fetches in flight per exchange as (started, priority, done event)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def refresh(self, names=None, priority=NORMAL, wait_running=False):
+        requested = monotonic()
+        names = list(names or exchanges.keys())
+        # The lock only guards claiming and recording, so an interactive refresh never queues behind a slow fetch
+        fetch_names, running = [], set()
+        with self._lock:
+            for name in names:
+                if self._refresh_started.get(name, 0) >= requested:
+                    continue
+                # A running fetch is joined if it is at least as urgent, a background one never delays a user
+                in_flight = self._in_flight.get(name)
+                if in_flight and (wait_running or in_flight[0] >= requested or in_flight[1] <= priority):
+                    running.add(in_flight[2])
+                else:
+                    fetch_names.append(name)
+            started, done = monotonic(), threading.Event()
+            for name in fetch_names:
+                self._in_flight[name] = (started, priority, done)
+
+        if fetch_names:
+            try:
+                balances, errors = fetch_balances(fetch_names, priority=priority)
+                with self._lock:
+                    for name in fetch_names:
+                        # A slower fetch that started earlier never overwrites a newer result
+                        if self._refresh_started.get(name, 0) > started:
+                            continue
+                        self._refresh_started[name] = started
+                        if name in balances:
+                            self.snapshots[name] = (balances[name], time.time())
+                            self.errors.pop(name, None)
+                        else:
+                            self.errors[name] = errors[name]
+            finally:
+                with self._lock:
+                    for name in fetch_names:
+                        if self._in_flight.get(name, (None, None, None))[2] is done:
+                            del self._in_flight[name]
+                done.set()
+        for event in running:
+            event.wait()
+
+    def get(self, names, fresh=False, priority=INTERACTIVE):
+        names = list(names)
+        if fresh:
+            self.refresh(names, priority=priority)
+        else:
+            # Only exchanges never asked yet are fetched, failing ones wait for the next background refresh
+            missing = [name for name in names if name not in self._refresh_started]
+            if missing:
+                self.refresh(missing, priority=priority, wait_running=True)
+        with self._lock:
+            balances = {name: self.snapshots[name][0] for name in names if name in self.snapshots}
+            timestamps = {name: self.snapshots[name][1] for name in names if name in self.snapshots}
+            errors = {name: self.errors[name] for name in names if name in self.errors and name not in balances}
+        return balances, timestamps, errors
+
+    def run(self):
+        errors_count = 0
+        while True:
+            try:
+                self.refresh(priority=BACKGROUND)
+                errors_count = 0
+                if not self.schedule.wait():
+                    break
+            except KeyboardInterrupt:
+                break
+            except SystemExit:
+                raise
+            except Exception as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
+                errors_count += 1
+                if errors_count > 10:
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
+                    break
+                else:
+                    time.sleep(1)
+
+
+def read_sql(file_name):
+    with open(file_name, encoding='utf8') as sql_file:
+        sql = sql_file.read()
+    return sql.replace('#fund_balances#', config.schema.fund_balances).replace('#fund_nav#', config.schema.fund_nav)
+
+
+def load_nav_history(db, quote, date_from, date_to, points=30):
+    # Records are averaged into at most the requested number of buckets, an index range scan on (quote, time)
+    bucket = max(1, int((date_to - date_from).total_seconds() / points))
+    data = {'quote': quote, 'date_from': date_from, 'date_to': date_to, 'bucket': bucket}
+    return db.execute(read_sql('sql/select_fund_nav.sql'), data)
+
+
+class BalanceRecorder(threading.Thread):
+    def __init__(self, interval=3600):
+        super(BalanceRecorder, self).__init__(name='BalanceRecorder')
+        self.daemon = True
+        self.schedule = PollScheduler(interval=interval)
+
+    def record(self, db):
+        started = time.time()
+        balances, timestamps, errors = balance_snapshots.get(exchanges.keys(), fresh=True, priority=BACKGROUND)
+        graph = conversion_graphs.get()
+        recorded_at = datetime.now(timezone.utc)
+        # Complete only if every exchange answered this time and every coin got a price, a stale snapshot
+        # could hide an exchange that is failing right now
+        complete = (not errors and not conversion_graphs.errors
+                    and all(timestamps.get(name, 0) >= started for name in exchanges))
+
+        balance_rows = []
+        for name, balance in balances.items():
+            for currency, total in balance['total'].items():
+                if total:
+                    balance_rows.append((recorded_at, name, currency, balance['free'].get(currency),
+                                         balance['used'].get(currency), total))
+        nav_rows = []
+        for quote in QUOTE_CURRENCIES:
+            nav = graph.value({name: balance['total'] for name, balance in balances.items()}, quote)
+            nav_rows.append((recorded_at, quote, nav['total'], complete and not nav['unpriced']))
+
+        # One transaction per snapshot, history never has half of one
+        try:
+            db.execute_values(read_sql('sql/insert_fund_balances.sql'), balance_rows)
+            db.execute_values(read_sql('sql/insert_fund_nav.sql'), nav_rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return len(balance_rows)
+
+    def run(self):
+        from database import Postgres
+
+        errors_count = 0
+        while True:
+            db = None
+            try:
+                db = Postgres(config=config.db)
+                db.execute_nofetch(read_sql('sql/create_fund_history.sql'))
+                db.commit()
+                while True:
+                    rows_count = self.record(db)
+                    console.log('{:20}: {}'.format(self.name, 'Recorded {} balances'.format(rows_count)), n=1)
+                    errors_count = 0
+                    self.schedule.wait()
+            except KeyboardInterrupt:
+                break
+            except SystemExit:
+                raise
+            except Exception as e:
+                console.log('{:20}: {}'.format(self.name, str(e)), is_ok=0)
+                telebot.log('{:20}: {}'.format(self.name, str(e)))
+                errors_count += 1
+                if errors_count > 10:
+                    console.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'), is_ok=0)
+                    telebot.log('{:20}: {}'.format(self.name, 'Too many errors. Stopping'))
+                    break
+                else:
+                    time.sleep(10)
+            finally:
+                if db:
+                    db.destroy()
+
+
+def format_age(timestamps):
+    if not timestamps:
+        return 'no data'
+    age = time.time() - min(timestamps)
+    if age < 120:
+        return '{:.0f}s old'.format(age)
+    elif age < 7200:
+        return '{:.0f}m old'.format(age / 60)
+    return '{:.0f}h old'.format(age / 3600)
+
+
+def format_errors(errors, title='No data from:'):
+    msg = ''
+    for name, error in errors.items():
+        msg += '\n{}: {}'.format(name, error)
+    return '\n\n' + title + msg if msg else ''
 
 
 class TelegramCommands:
@@ -42,45 +322,168 @@ class TelegramCommands:
     def show_help(bot, update):
         msg = '<pre>'
         msg += 'View balance\n'
-        msg += '  /balance [grouping] [blocking] [symbol]\n'
+        msg += '  /balance [grouping] [blocking] [symbol] [fresh]\n'
         msg += '    grouping: exchange name, sum, (every)\n'
         msg += '    blocking: free, used, (total)\n'
         msg += '    symbol:   currency symbol, (any)\n'
+        msg += '    fresh:    refresh before answering\n'
         msg += '\n'
         msg += '  example: /balance bitstamp used\n'
         msg += '  example: /balance bittrex BTC\n'
         msg += '  example: /balance sum\n'
+        msg += '  example: /balance sum fresh\n'
+        msg += '\n'
+        msg += 'View fund value\n'
+        msg += '  /nav [quote] [fresh]\n'
+        msg += '    quote: {}\n'.format(', '.join(QUOTE_CURRENCIES))
+        msg += '    fresh: refresh balances before answering\n'
+        msg += '\n'
+        msg += '  example: /nav BTC\n'
+        msg += '\n'
+        msg += 'View fund value history\n'
+        msg += '  /history [quote] [days]\n'
+        msg += '    quote: {}\n'.format(', '.join(QUOTE_CURRENCIES))
+        msg += '    days:  (30)\n'
+        msg += '\n'
+        msg += '  example: /history BTC 7\n'
+        msg += '\n'
+        msg += 'View exchange request rates and waits\n'
+        msg += '  /limits\n'
         msg += '</pre>'
 
         bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
 
+    @staticmethod
+    def get_nav(bot, update):
+        quote = QUOTE_CURRENCIES[0]
+        fresh = False
+        for arg in update.message.text.split(' ')[1:]:
+            if arg.upper() in QUOTE_CURRENCIES:
+                quote = arg.upper()
+            elif arg == 'fresh':
+                fresh = True
+
+        console.log('{:<15} {:<20}: /nav [quote: {}, fresh: {}]'
+                    .format(update.message.chat_id, TelegramCommands.get_chat_name(update.message.chat),
+                            quote, str(fresh)), n=1)
+        balances, timestamps, errors = balance_snapshots.get(exchanges.keys(), fresh=fresh)
+        graph = conversion_graphs.get()
+        ticker_errors = conversion_graphs.errors
+        nav = graph.value({name: balance['total'] for name, balance in balances.items()}, quote)
+        digits = 8 if quote == 'BTC' else 2
+
+        msg = '<pre>'
+        msg += 'NAV {} ({})'.format(quote, format_age(timestamps.values()))
+        msg += '\nTotal: {:.{}f}\n'.format(nav['total'], digits)
+        for name, value in sorted(nav['exchanges'].items(), key=lambda item: -item[1]):
+            msg += '\n{:10} {:>18.{}f}'.format(name, value, digits)
+        msg += '\n'
+        for coin, (amount, value) in sorted(nav['assets'].items(), key=lambda item: -item[1][1]):
+            if value >= 10**-digits:
+                msg += '\n{:6} {:>18.8f} {:>18.{}f}'.format(coin, amount, value, digits)
+        if nav['unpriced']:
+            msg += '\n\nNo price for:'
+            for coin, amount in nav['unpriced'].items():
+                msg += '\n{:6} {:>18.8f}'.format(coin, amount)
+        msg += format_errors(ticker_errors, title='No prices from:')
+        msg += format_errors(errors)
+        msg += '</pre>'
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
+
+    @staticmethod
+    def get_limits(bot, update):
+        console.log('{:<15} {:<20}: /limits'.format(update.message.chat_id,
+                                                    TelegramCommands.get_chat_name(update.message.chat)), n=1)
+        msg = '<pre>'
+        msg += '{:10} {:>6} {:>6} {:>6} {:>7} {:>7}'.format('EXCHANGE', 'REQ/S', 'CALLS', 'QUEUE', 'AVG', 'MAX')
+        for name, exchange in exchanges.items():
+            if exchange.limiter is None:
+                msg += '\n{:10} {:>6}'.format(name, 'idle')
+                continue
+            stats = exchange.limiter.stats()
+            msg += '\n{:10} {:>6.2f} {:>6} {:>6} {:>6.2f}s {:>6.2f}s'.format(
+                name, stats['rate'], stats['calls'], stats['queued'], stats['avg_wait'], stats['max_wait'])
+        msg += '</pre>'
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
+
+    @staticmethod
+    def get_history(bot, update):
+        from database import Postgres
+
+        quote = QUOTE_CURRENCIES[0]
+        days = 30
+        for arg in update.message.text.split(' ')[1:]:
+            if arg.upper() in QUOTE_CURRENCIES:
+                quote = arg.upper()
+            elif arg.isdigit():
+                days = int(arg)
+
+        console.log('{:<15} {:<20}: /history [quote: {}, days: {}]'
+                    .format(update.message.chat_id, TelegramCommands.get_chat_name(update.message.chat),
+                            quote, days), n=1)
+        date_to = datetime.now(timezone.utc)
+        db = None
+        try:
+            db = Postgres(config=config.db)
+            history = load_nav_history(db, quote=quote, date_from=date_to - timedelta(days=days), date_to=date_to,
+                                       points=config.balance_history.points or 30)
+        except Exception as e:
+            console.log('{:20}: {}'.format('History', str(e)), is_ok=0)
+            if config.debug:
+                bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                                 text='<pre>{}</pre>'.format(escape(format_exc())))
+            bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML',
+                             text='History is not available right now, try again later.')
+            return
+        finally:
+            if db:
+                db.destroy()
+        digits = 8 if quote == 'BTC' else 2
+
+        msg = '<pre>'
+        msg += 'NAV {} ({} days)'.format(quote, days)
+        first_value = history[0][1] if history else None
+        for bucket, value in history:
+            msg += '\n{:%Y-%m-%d %H:%M} {:>18.{}f} {:>+7.1%}'.format(bucket, value, digits,
+                                                                    value / first_value - 1 if first_value else 0.0)
+        if not history:
+            msg += '\nNo records yet'
+        msg += '</pre>'
+        bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
+
     @staticmethod
     def get_balance(bot, update):
         try:
             exchange = 'every'
             blocking = 'total'
             symbol = None
+            fresh = False
             for arg in update.message.text.split(' ')[1:]:
                 if arg in ('free', 'used', 'total'):
                     blocking = arg
+                elif arg == 'fresh':
+                    fresh = True
                 elif (arg in ('every', 'sum')) or (arg in exchanges.keys()):
                     exchange = arg
                 elif arg.isupper():
                     symbol = arg
 
-            console.log('{:<15} {:<20}: /balance [exchange: {}, symbol: {}, blocking: {}]'
+            console.log('{:<15} {:<20}: /balance [exchange: {}, symbol: {}, blocking: {}, fresh: {}]'
                         .format(update.message.chat_id, TelegramCommands.get_chat_name(update.message.chat),
-                                str(exchange), str(symbol), str(blocking)), n=1)
+                                str(exchange), str(symbol), str(blocking), str(fresh)), n=1)
             if exchange == 'every':
+                balances, timestamps, errors = balance_snapshots.get(exchanges.keys(), fresh=fresh)
                 for exchange in exchanges.keys():
-                    balance = exchanges[exchange].fetch_balance()
                     msg = '<pre>'
-                    msg += 'Balance {} ({})'.format(blocking, exchange)
-                    if symbol:
-                        if symbol in balance[blocking]:
-                            msg += '\n{}: {:.8f}'.format(symbol, balance[blocking][symbol])
+                    msg += 'Balance {} ({}, {})'.format(blocking, exchange, format_age(
+                        [timestamps[exchange]] if exchange in timestamps else []))
+                    if exchange in errors:
+                        msg += '\nNo data: {}'.format(errors[exchange])
+                    elif symbol:
+                        if symbol in balances[exchange][blocking]:
+                            msg += '\n{}: {:.8f}'.format(symbol, balances[exchange][blocking][symbol])
                     else:
-                        for sym, bal in balance[blocking].items():
+                        for sym, bal in balances[exchange][blocking].items():
                             if bal:
                                 msg += '\n{}: {:.8f}'.format(sym, bal)
                     msg += '</pre>'
@@ -88,8 +491,8 @@ class TelegramCommands:
 
             elif exchange == 'sum':
                 summary = {}
-                for exchange in exchanges.keys():
-                    balance = exchanges[exchange].fetch_balance()
+                balances, timestamps, errors = balance_snapshots.get(exchanges.keys(), fresh=fresh)
+                for balance in balances.values():
                     if symbol:
                         if symbol in balance[blocking]:
                             if symbol in summary.keys():
@@ -103,25 +506,28 @@ class TelegramCommands:
                             else:
                                 summary[sym] = bal
                 msg = '<pre>'
-                msg += 'Balance {} ({})'.format(blocking, 'summary')
+                msg += 'Balance {} ({}, {})'.format(blocking, 'summary', format_age(timestamps.values()))
                 if symbol:
-                    msg += '\n{}: {:.8f}'.format(symbol, summary[symbol])
+                    msg += '\n{}: {:.8f}'.format(symbol, summary.get(symbol, 0.0))
                 else:
                     for sym, bal in summary.items():
                         if bal:
                             msg += '\n{}: {:.8f}'.format(sym, bal)
+                msg += format_errors(errors)
                 msg += '</pre>'
                 bot.send_message(chat_id=update.message.chat_id, parse_mode='HTML', text=msg)
 
             else:
-                balance = exchanges[exchange].fetch_balance()
+                balances, timestamps, errors = balance_snapshots.get([exchange], fresh=fresh)
                 msg = '<pre>'
-                msg += 'Balance {} ({})'.format(blocking, exchange)
-                if symbol:
-                        if symbol in balance[blocking]:
-                            msg += '\n{}: {:.8f}'.format(symbol, balance[blocking][symbol])
+                msg += 'Balance {} ({}, {})'.format(blocking, exchange, format_age(timestamps.values()))
+                if exchange in errors:
+                    msg += '\nNo data: {}'.format(errors[exchange])
+                elif symbol:
+                    if symbol in balances[exchange][blocking]:
+                        msg += '\n{}: {:.8f}'.format(symbol, balances[exchange][blocking][symbol])
                 else:
-                    for sym, bal in balance[blocking].items():
+                    for sym, bal in balances[exchange][blocking].items():
                         if bal:
                             msg += '\n{}: {:.8f}'.format(sym, bal)
                 msg += '</pre>'
@@ -136,16 +542,41 @@ class TelegramCommands:
                              text='Invalid command. Type /help to get help.')
 
 
+def create_app(app_config=None):
+    global config, console, telebot, balance_snapshots, conversion_graphs, balance_recorder
+    config = app_config or load_config(default_config_path=DEFAULT_CONFIG_PATH)
+    console = Console(log_file_name=config.log_file_path)
+    telebot = Telegram(config=config.telegram)
+
+    exchanges.clear()
+    rate_limits = config.rate_limits or Config()
+    for name, api_id in EXCHANGES.items():
+        rate_limit = getattr(rate_limits, name) or Config()
+        exchanges[name] = Exchange(name=name, api_id=api_id, api_config=getattr(config, name).to_dict(),
+                                   markets_cache_path=config.markets_cache_path,
+                                   markets_cache_ttl=config.markets_cache_ttl or 86400,
+                                   rate_limit=rate_limit.rate_limit, burst=rate_limit.burst or 1)
+    balance_snapshots = BalanceSnapshots(interval=config.balance_refresh_interval or 60)
+    if config.balance_history:
+        balance_recorder = BalanceRecorder(interval=config.balance_history.interval or 3600)
+    conversion_graphs = ConversionGraphCache(fetch=fetch_tickers, ttl=config.tickers_ttl or 60,
+                                             fixed_rates=config.fixed_rates.to_dict() if config.fixed_rates else {})
+
+
 def main():
+    if config is None:
+        create_app()
     console.log('Starting...')
+    balance_snapshots.start()
+    if balance_recorder:
+        balance_recorder.start()
 
-    exchanges['bitstamp'] = Exchange(ccxt.bitstamp(config=config.bitstamp.to_dict()))
-    exchanges['binance'] = Exchange(ccxt.binance(config=config.binance.to_dict()))
-    exchanges['bittrex'] = Exchange(ccxt.bittrex(config=config.bittrex.to_dict()))
-    exchanges['cryptopia'] = Exchange(ccxt.cryptopia(config=config.cryptopia.to_dict()))
-    exchanges['hitbtc'] = Exchange(ccxt.hitbtc2(config=config.hitbtc.to_dict()))
-
+    import telegram.ext as telegram
     telebot.add_handler(telegram.CommandHandler(command='balance', callback=TelegramCommands.get_balance))
+    telebot.add_handler(telegram.CommandHandler(command='nav', callback=TelegramCommands.get_nav))
+    telebot.add_handler(telegram.CommandHandler(command='limits', callback=TelegramCommands.get_limits))
+    if balance_recorder:
+        telebot.add_handler(telegram.CommandHandler(command='history', callback=TelegramCommands.get_history))
     telebot.add_handler(telegram.CommandHandler(command='start', callback=TelegramCommands.start))
     telebot.add_handler(telegram.CommandHandler(command='help', callback=TelegramCommands.show_help))
     telebot.start()
@@ -0,0 +1,17 @@
+CREATE TABLE IF NOT EXISTS #fund_balances# (
+    recorded_at timestamptz NOT NULL,
+    exchange text NOT NULL,
+    currency text NOT NULL,
+    free double precision,
+    used double precision,
+    total double precision NOT NULL,
+    PRIMARY KEY (recorded_at, exchange, currency)
+);
+
+CREATE TABLE IF NOT EXISTS #fund_nav# (
+    recorded_at timestamptz NOT NULL,
+    quote text NOT NULL,
+    value double precision NOT NULL,
+    complete boolean NOT NULL,
+    PRIMARY KEY (quote, recorded_at)
+);
@@ -0,0 +1,4 @@
+INSERT INTO #fund_balances# (recorded_at, exchange, currency, free, used, total)
+VALUES %s
+ON CONFLICT DO NOTHING
+;
@@ -0,0 +1,4 @@
+INSERT INTO #fund_nav# (recorded_at, quote, value, complete)
+VALUES %s
+ON CONFLICT DO NOTHING
+;
@@ -0,0 +1,12 @@
+SELECT
+    to_timestamp(floor(extract(EPOCH FROM recorded_at) / %(bucket)s) * %(bucket)s) AS bucket,
+    avg(value) AS value
+FROM #fund_nav#
+WHERE TRUE
+    AND quote=%(quote)s
+    AND complete
+    AND recorded_at>=%(date_from)s
+    AND recorded_at<%(date_to)s
+GROUP BY bucket
+ORDER BY bucket
+;
@@ -0,0 +1,14 @@
+SELECT
+    order_id,
+    (extract(EPOCH FROM order_date)*1000)::bigint AS order_timestamp,
+    user_name,
+    order_side,
+    amount_trade::double precision,
+    price::double precision
+FROM #trades#
+WHERE TRUE
+    AND symbol=%(symbol)s
+    AND order_date>=%(date_from)s
+    AND order_date<%(date_to)s
+ORDER BY order_date, order_id
+;
@@ -0,0 +1,53 @@
+import queue
+import threading
+
+import pytest
+
+pytest.importorskip('colorama')
+
+import autotrader
+from exchange_simulator import SimulatedExchange
+from utils import load_config
+
+SYMBOL = 'BTC/UAH'
+NOW = 10**12
+
+
+@pytest.fixture
+def analyzer():
+    config = load_config(default_config_path='sample_configs/autotrader_sample.json', parse_cmd_line=False)
+    config.log_file_path = None
+    config.trace_log_path = None
+    config.max_trade_age = 600
+    config.flow_window = None
+    exchange = SimulatedExchange(symbol=SYMBOL, balances={})
+    exchange.on_trade({'timestamp': NOW, 'side': 'buy', 'amount': 1.0, 'price': 100.0})
+    autotrader.create_app(app_config=config, ex_api=exchange)
+    autotrader.console.silent = True
+    autotrader.telebot.log_chat_id = None
+    yield autotrader.Analyzer(ex_api=exchange, symbol=SYMBOL, target_user_trades=queue.Queue(),
+                              target_user_trades_fetched=threading.Event(), trader_commands=queue.Queue())
+    autotrader.trace_log.close()
+    autotrader.console.close()
+
+
+def trade(side, amount, age=0):
+    return {'timestamp': NOW - age*1000, 'symbol': SYMBOL, 'side': side, 'amount': amount, 'price': 100.0,
+            'info': {'user': 'target'}}
+
+
+def test_fast_combination_keeps_previous_signal(analyzer):
+    command = analyzer.process_trades([trade('buy', 10.0)])
+    assert (command['side'], command['amount']) == ('buy', 10.0)
+
+    assert analyzer.process_trades([trade('sell', 9.0)]) is None
+
+    command = analyzer.process_trades([trade('sell', 5.0)])
+    assert (command['side'], command['amount']) == ('sell', 14.0)
+
+
+def test_trade_at_age_limit_is_traded(analyzer):
+    # Accepted by the watcher just under max_trade_age, the Analyzer only gets to it a moment later
+    analyzer.ex_api.now = NOW + 2000
+    command = analyzer.process_trades([trade('buy', 2.0, age=599)])
+    assert (command['side'], command['amount']) == ('buy', 2.0)
@@ -0,0 +1,23 @@
+from urllib.parse import urlparse
+
+import pytest
+
+ccxt = pytest.importorskip('ccxt')
+
+from exchange_simulator import ExchangeSimulator
+from utils import Config
+
+
+def test_fetch_trades_returns_every_scripted_trade():
+    simulator = ExchangeSimulator(config=Config({'pairs': {'BTC/UAH': {'price': 100000.0}}}))
+    pair = simulator.pair('btc_uah')
+    deals = [pair.trade(user='target{}'.format(index % 3), side=('buy', 'sell')[index % 2], amount=index + 1.0)
+             for index in range(20)]
+
+    api = ccxt.btctradeua()
+    api.fetch = lambda url, method='GET', headers=None, body=None: simulator.handle(method, urlparse(url).path, {})
+    trades = api.fetch_trades('BTC/UAH')
+
+    assert sorted(trade['id'] for trade in trades) == sorted(str(deal['id']) for deal in deals)
+    assert sorted((trade['info']['user'], trade['side'], trade['amount']) for trade in trades) == \
+        sorted((deal['user'], deal['type'], float(deal['amnt_trade'])) for deal in deals)
@@ -0,0 +1,71 @@
+import json
+import threading
+from collections import deque
+
+from utils import LogWriter
+
+
+STAGES = ('exchange', 'detected', 'decided', 'dequeued', 'placed')
+
+
+def stamp(trace, stage, timestamp):
+    if trace is not None:
+        trace[stage] = timestamp
+    return trace
+
+
+def stage_latencies(trace):
+    latencies = {}
+    for prev_stage, stage in zip(STAGES, STAGES[1:]):
+        if prev_stage in trace and stage in trace:
+            latencies[stage] = (trace[stage] - trace[prev_stage]) / 1000
+    if STAGES[0] in trace and STAGES[-1] in trace:
+        latencies['total'] = (trace[STAGES[-1]] - trace[STAGES[0]]) / 1000
+    return latencies
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class TraceLog:
+    def __init__(self, file_name=None, max_samples=10000, on_record=None):
+        self.on_record = on_record
+        self._samples = {stage: deque(maxlen=max_samples) for stage in STAGES[1:] + ('total',)}
+        self._lock = threading.Lock()
+        self._writer = None
+        if file_name:
+            self._writer = LogWriter(file_name=file_name)
+            self._writer.start()
+
+    def record(self, trace):
+        latencies = stage_latencies(trace)
+        with self._lock:
+            for stage, latency in latencies.items():
+                self._samples[stage].append(latency)
+        if self.on_record:
+            self.on_record(latencies)
+        if self._writer:
+            self._writer.write(json.dumps(trace, separators=(',', ':')) + '\n')
+        return latencies
+
+    def percentiles(self, qs=(0.5, 0.99)):
+        with self._lock:
+            samples = {stage: sorted(values) for stage, values in self._samples.items()}
+        return {
+            stage: tuple(percentile(values, q) for q in qs)
+            for stage, values in samples.items()
+            if values
+        }
+
+    def report(self):
+        lines = []
+        for stage, (p50, p99) in self.percentiles().items():
+            lines.append('{:10} p50: {:8.3f}s p99: {:8.3f}s'.format(stage, p50, p99))
+        return '\n'.join(lines)
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
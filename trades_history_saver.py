@@ -1,10 +1,10 @@
-from datetime import datetime
-from time import sleep
+from time import sleep, monotonic
 
 import ccxt
 
 from utils import load_config, Console
 from database import Postgres
+from scheduler import PollScheduler
 
 
 DEBUG = False
@@ -60,21 +60,14 @@ def main():
             btctradeua_pairs = list(btctradeua_api.load_markets(reload=True).keys())
             cout('There are {} pairs on btctradeua'.format(len(btctradeua_pairs)), n=1)
 
-            everything_is_actual = True
-            while everything_is_actual:
+            schedule = PollScheduler.from_config(config.poll, default_interval=300)
+            reconnect_at = monotonic() + (config.reconnect_interval or 3600)
+            while monotonic() < reconnect_at:
                 cout('', n=1)
                 save_btctradeua_trades(db=db, api=btctradeua_api, pairs=btctradeua_pairs)
 
                 cout('Waiting...')
-                while True:
-                    now = datetime.now()
-                    if now.minute == 0 and now.second == 0:
-                        everything_is_actual = False
-                        break
-                    elif now.minute % 5 == 0 and now.second == 0:
-                        break
-                    else:
-                        sleep(0.5)
+                schedule.wait()
                 errors_count = 0
         except KeyboardInterrupt:
             break
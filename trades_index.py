@@ -0,0 +1,70 @@
+import os
+import json
+from collections import deque
+
+
+class TradesIndex:
+    def __init__(self, file_name=None, retention=3600, max_size=100000):
+        self.file_name = file_name
+        self.retention = retention
+        self.max_size = max_size
+
+        self.last_timestamp = 0
+        self.last_id = None
+        # Every trade at or before this timestamp has already been evicted from the set as seen
+        self.floor_timestamp = 0
+        self._ids = set()
+        self._trades = deque()
+        self._dirty = False
+
+        self.load()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def contains(self, trade):
+        return trade['timestamp'] <= self.floor_timestamp or trade['id'] in self._ids
+
+    def add(self, trade):
+        if self.contains(trade):
+            return
+        self._ids.add(trade['id'])
+        self._trades.append((trade['timestamp'], trade['id']))
+        if trade['timestamp'] >= self.last_timestamp:
+            self.last_timestamp, self.last_id = trade['timestamp'], trade['id']
+        self._dirty = True
+        self._evict()
+
+    def _evict(self):
+        min_timestamp = self.last_timestamp - self.retention*1000
+        while self._trades and (self._trades[0][0] < min_timestamp or len(self._trades) > self.max_size):
+            timestamp, trade_id = self._trades.popleft()
+            self._ids.discard(trade_id)
+            self.floor_timestamp = max(self.floor_timestamp, timestamp)
+
+    def load(self):
+        if not self.file_name or not os.path.exists(self.file_name):
+            return
+        with open(self.file_name, encoding='utf8') as index_file:
+            state = json.load(index_file)
+        self.floor_timestamp = state['floor_timestamp']
+        self.last_timestamp = state['last_timestamp']
+        self.last_id = state['last_id']
+        self._trades = deque(sorted((timestamp, trade_id) for timestamp, trade_id in state['trades']))
+        self._ids = set(trade_id for _, trade_id in self._trades)
+        self._evict()
+
+    def save(self):
+        if not self.file_name or not self._dirty:
+            return
+        state = {
+            'floor_timestamp': self.floor_timestamp,
+            'last_timestamp': self.last_timestamp,
+            'last_id': self.last_id,
+            'trades': list(self._trades),
+        }
+        tmp_file_name = self.file_name + '.tmp'
+        with open(tmp_file_name, 'w', encoding='utf8') as index_file:
+            json.dump(state, index_file)
+        os.replace(tmp_file_name, self.file_name)
+        self._dirty = False
@@ -1,10 +1,11 @@
 import os
 import json
+import queue
+import atexit
+import threading
 from sys import argv
-from time import time, strftime
+from time import time, strftime, sleep, monotonic
 
-import telegram
-import telegram.ext
 from colorama import Fore as colors
 
 
@@ -75,39 +76,254 @@ class Config:
 
 
 class Telegram:
+    MAX_MESSAGE_LENGTH = 4096
+
     def __init__(self, config):
         self.config = config
         self.log_chat_id = config.log_chat_id
-        self._bot = telegram.Bot(token=config.bot_token)
-        self._updater = telegram.ext.Updater(bot=self._bot)
+        # The bot, the updater and the sender thread are only created once something needs them
+        self._bot = None
+        self._updater = None
+        self._lock = threading.Lock()
+
+        # Log messages go through a bounded queue and a sender thread, so callers never wait on Telegram
+        self.batch_window = config.batch_window or 1.0
+        self.min_send_interval = config.min_send_interval or 3.0
+        self.dropped_count = 0
+        self._messages = queue.Queue(maxsize=config.queue_size or 100)
+        self._last_sent = 0
+        self._sender = None
+
+    @property
+    def bot(self):
+        with self._lock:
+            if self._bot is None:
+                import telegram
+                self._bot = telegram.Bot(token=self.config.bot_token)
+            return self._bot
+
+    @property
+    def updater(self):
+        bot = self.bot
+        with self._lock:
+            if self._updater is None:
+                import telegram.ext
+                self._updater = telegram.ext.Updater(bot=bot)
+            return self._updater
 
     def log(self, msg):
         if self.log_chat_id:
-            self._bot.send_message(chat_id=self.log_chat_id, text=msg, parse_mode='HTML')
+            if self._sender is None:
+                with self._lock:
+                    if self._sender is None:
+                        self._sender = threading.Thread(target=self._send_loop, daemon=True)
+                        self._sender.start()
+            try:
+                self._messages.put_nowait(msg)
+            except queue.Full:
+                self.dropped_count += 1
+
+    def _collect(self, pending):
+        # Waits up to batch_window for more messages, returns True once the flush/stop sentinel was read
+        deadline = monotonic() + self.batch_window
+        while len('\n'.join(pending)) <= self.MAX_MESSAGE_LENGTH:
+            try:
+                msg = self._messages.get(timeout=max(0.0, deadline - monotonic()))
+            except queue.Empty:
+                return False
+            if msg is None:
+                return True
+            pending.append(msg)
+        return False
+
+    def _next_batch(self, pending):
+        # Whole messages only, so a <pre> block is never cut in half, the dropped note counts towards the limit
+        note = None
+        if self.dropped_count:
+            dropped_count, self.dropped_count = self.dropped_count, 0
+            note = '<i>{} messages dropped</i>'.format(dropped_count)
+        budget = self.MAX_MESSAGE_LENGTH - (len(note) + 1 if note else 0)
+        batch = []
+        length = -1
+        while pending and length + 1 + len(pending[0]) <= budget:
+            length += 1 + len(pending[0])
+            batch.append(pending.pop(0))
+        if not batch and pending:
+            # A single message over the limit can only be cut
+            batch.append(pending.pop(0)[:budget])
+        if note:
+            batch.append(note)
+        return batch
+
+    def _send_loop(self):
+        from telegram.error import RetryAfter
+        pending = []
+        stop = False
+        while True:
+            if not pending:
+                if stop:
+                    return
+                msg = self._messages.get()
+                if msg is None:
+                    return
+                pending.append(msg)
+            if not stop:
+                stop = self._collect(pending)
+            batch = self._next_batch(pending)
+
+            wait_time = self._last_sent + self.min_send_interval - monotonic()
+            if wait_time > 0:
+                sleep(wait_time)
+            try:
+                self.bot.send_message(chat_id=self.log_chat_id, text='\n'.join(batch),
+                                      parse_mode='HTML')
+            except RetryAfter as e:
+                self.dropped_count += len(batch)
+                sleep(e.retry_after)
+            except Exception:
+                self.dropped_count += len(batch)
+            self._last_sent = monotonic()
+
+    def flush(self, timeout=5.0):
+        if self._sender is None:
+            return
+        try:
+            self._messages.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._sender.join(timeout=timeout)
+        with self._lock:
+            if not self._sender.is_alive():
+                # The next log starts a new sender thread
+                self._sender = None
 
     def add_handler(self, handler):
-        self._updater.dispatcher.add_handler(handler)
+        self.updater.dispatcher.add_handler(handler)
 
     def start(self):
-        self._updater.start_polling(clean=True, timeout=30.0, bootstrap_retries=-1)
+        self.updater.start_polling(clean=True, timeout=30.0, bootstrap_retries=-1)
 
     def stop(self):
         if self.is_alive():
             self._updater.stop()
+        self.flush()
 
     def is_alive(self):
-        return self._updater.running
+        return self._updater is not None and self._updater.running
 
     def idle(self):
-        return self._updater.idle()
+        return self.updater.idle()
+
+
+class LogWriter(threading.Thread):
+    def __init__(self, file_name, flush_interval=1.0, buffer_size=64*1024,
+                 max_file_size=None, rotate_interval=None, backup_count=5):
+        super(LogWriter, self).__init__()
+        self.daemon = True
+        self.file_name = file_name
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.max_file_size = max_file_size
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self._records = queue.SimpleQueue()
+        self._buffer = []
+        self._buffered_size = 0
+        self._file = None
+        self._opened_at = None
+
+    def write(self, line):
+        self._records.put(line)
+
+    def close(self, timeout=5.0):
+        if self.is_alive():
+            self._records.put(None)
+            self.join(timeout=timeout)
+
+    def _open(self):
+        self._file = open(self.file_name, 'a+', encoding='utf8')
+        self._opened_at = monotonic()
+
+    def _should_rotate(self):
+        if self.max_file_size and self._file.tell() >= self.max_file_size:
+            return True
+        if self.rotate_interval and monotonic() - self._opened_at >= self.rotate_interval:
+            return True
+        return False
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            backup_name = '{}.{}'.format(self.file_name, index)
+            if os.path.exists(backup_name):
+                os.replace(backup_name, '{}.{}'.format(self.file_name, index + 1))
+        if self.backup_count:
+            os.replace(self.file_name, '{}.1'.format(self.file_name))
+        else:
+            os.remove(self.file_name)
+        self._open()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        if self._file is None:
+            self._open()
+        self._file.write(''.join(self._buffer))
+        self._file.flush()
+        self._buffer, self._buffered_size = [], 0
+        if self._should_rotate():
+            self._rotate()
+
+    def run(self):
+        next_flush = monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    line = self._records.get(timeout=max(0.0, next_flush - monotonic()))
+                except queue.Empty:
+                    line = ''
+                if line is None:
+                    break
+                if line:
+                    self._buffer.append(line)
+                    self._buffered_size += len(line)
+                if self._buffered_size >= self.buffer_size or monotonic() >= next_flush:
+                    self._flush()
+                    next_flush = monotonic() + self.flush_interval
+        finally:
+            self._flush()
+            if self._file:
+                self._file.close()
 
 
 class Console:
     def __init__(self, log_file_name=None,
-                 console_width=150, silent=False):
+                 console_width=150, silent=False,
+                 buffered=False, json_lines=False, **writer_options):
         self.log_file_name = log_file_name
         self.console_width = console_width
         self.silent = silent
+        self.json_lines = json_lines
+
+        # Buffered mode hands file records to a background writer, so logging costs callers only an enqueue
+        self._writer = None
+        if self.log_file_name and buffered:
+            self._writer = LogWriter(file_name=self.log_file_name, **writer_options)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def close(self):
+        if self._writer:
+            self._writer.close()
+
+    def _format_record(self, text, is_ok):
+        if self.json_lines:
+            return json.dumps({
+                'time': text[:19],
+                'level': 'info' if is_ok else 'error',
+                'msg': text[20:].strip(),
+            }, ensure_ascii=False) + '\n'
+        return text.strip() + '\n'
 
     def log(self, msg, n=False, is_ok=True, div=False, color=None):
         if color == 'red':
@@ -137,9 +353,13 @@ class Console:
             print(start + text[:self.console_width] + end, end='', flush=True)
 
         if self.log_file_name and text and (n or not is_ok):
-            with open(self.log_file_name, 'a+', encoding='utf8') as log_file:
-                log_file.write(text.strip() + '\n')
-                log_file.flush()
+            record = self._format_record(text, is_ok)
+            if self._writer:
+                self._writer.write(record)
+            else:
+                with open(self.log_file_name, 'a+', encoding='utf8') as log_file:
+                    log_file.write(record)
+                    log_file.flush()
 
     def wait_for_kbhit(self, comment='Press any key to continue...', is_ok=True):
         text = '{} {:<300}'.format(strftime('%Y-%m-%d %H:%M:%S'), str(comment))[:self.console_width]
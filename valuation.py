@@ -0,0 +1,83 @@
+import threading
+from time import monotonic
+from collections import deque
+
+
+def ticker_price(ticker):
+    if ticker.get('bid') and ticker.get('ask'):
+        return (ticker['bid'] + ticker['ask']) / 2
+    return ticker.get('last') or None
+
+
+class ConversionGraph:
+    def __init__(self, tickers=(), fixed_rates=None):
+        self.edges = {}
+        self._rates = {}
+        for pair, rate in (fixed_rates or {}).items():
+            base, quote = pair.split('/')
+            self.add(base, quote, rate)
+        for exchange_tickers in tickers:
+            for symbol, ticker in exchange_tickers.items():
+                price = ticker_price(ticker)
+                if '/' in symbol and price:
+                    base, quote = symbol.split('/')
+                    self.add(base, quote, price)
+
+    def add(self, base, quote, rate):
+        # The first price of a pair wins, so fixed rates are never overridden by tickers
+        if quote in self.edges.get(base, {}):
+            return
+        self.edges.setdefault(base, {})[quote] = rate
+        self.edges.setdefault(quote, {})[base] = 1 / rate
+
+    def rates_to(self, quote):
+        # One BFS from the quote currency prices every reachable coin over its shortest conversion path
+        if quote not in self._rates:
+            rates = {quote: 1.0}
+            pending = deque([quote])
+            while pending:
+                coin = pending.popleft()
+                for neighbour, rate in self.edges.get(coin, {}).items():
+                    if neighbour not in rates:
+                        rates[neighbour] = rates[coin] / rate
+                        pending.append(neighbour)
+            self._rates[quote] = rates
+        return self._rates[quote]
+
+    def value(self, balances, quote):
+        rates = self.rates_to(quote)
+        result = {'total': 0.0, 'exchanges': {}, 'assets': {}, 'unpriced': {}}
+        for exchange, holdings in balances.items():
+            exchange_value = 0.0
+            for coin, amount in holdings.items():
+                if not amount:
+                    continue
+                if coin not in rates:
+                    result['unpriced'][coin] = result['unpriced'].get(coin, 0.0) + amount
+                    continue
+                value = amount * rates[coin]
+                exchange_value += value
+                asset_amount, asset_value = result['assets'].get(coin, (0.0, 0.0))
+                result['assets'][coin] = (asset_amount + amount, asset_value + value)
+            result['exchanges'][exchange] = exchange_value
+            result['total'] += exchange_value
+        return result
+
+
+class ConversionGraphCache:
+    def __init__(self, fetch, ttl=60.0, fixed_rates=None):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.fixed_rates = fixed_rates
+        self.errors = {}
+        self._graph = None
+        self._fetched_at = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._graph is None or monotonic() - self._fetched_at > self.ttl:
+                tickers, self.errors = self.fetch()
+                self._graph = ConversionGraph(tickers=tickers.values(), fixed_rates=self.fixed_rates)
+                self._fetched_at = monotonic()
+            return self._graph